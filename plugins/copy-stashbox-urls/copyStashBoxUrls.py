@@ -2,8 +2,13 @@
 
 import sys
 import json
+import hashlib
+import sqlite3
+import traceback
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple, Union
 
 try:
     from stashapi.stashapp import StashInterface
@@ -12,96 +17,422 @@ except ImportError:
     print("Error: stashapi library not found. Please ensure Stash is properly installed.", file=sys.stderr)
     sys.exit(1)
 
+# Optional: parse the large page responses with orjson when it is installed
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+# Number of entities fetched per page; bounds how many are held in memory at once
+PAGE_SIZE = 1000
+
+# Number of entity updates sent per GraphQL request
+UPDATE_BATCH_SIZE = 100
+
+# Record of entities already synced, so unchanged ones are skipped on later runs
+STATE_DB = Path.home() / '.cache' / 'stashbox-urls' / 'state.db'
+
+
+def minify_query(query: str) -> str:
+    """Collapse runs of whitespace in a GraphQL document, which the server ignores."""
+    return " ".join(query.split())
+
+
+INPUT_FIELDS_QUERY = minify_query("""
+    query InputFields($name: String!) {
+        __type(name: $name) {
+            inputFields {
+                name
+            }
+        }
+    }
+""")
+
+
+class SyncState:
+    """On-disk record of each entity's StashIDs as of its last successful sync."""
+
+    def __init__(self, server: str, entity_type: str, path: Path = STATE_DB):
+        """
+        Open (creating if needed) the state database and load this server's entries.
+
+        Args:
+            server: Stash server URL, so several Stash instances don't share state
+            entity_type: Type of entity ("scenes" or "performers")
+            path: SQLite database file
+        """
+        self.server = server
+        self.entity_type = entity_type
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS synced ("
+            "server TEXT, entity_type TEXT, entity_id TEXT, stash_ids_hash BLOB, "
+            "PRIMARY KEY (server, entity_type, entity_id))"
+        )
+        self._hashes: Dict[str, bytes] = dict(self._conn.execute(
+            "SELECT entity_id, stash_ids_hash FROM synced WHERE server = ? AND entity_type = ?",
+            (server, entity_type)
+        ))
+        self._changed: Dict[str, bytes] = {}
+
+    @staticmethod
+    def hash_stash_ids(stash_ids: Optional[List[Dict[str, str]]]) -> bytes:
+        """Return an order-independent digest of an entity's StashIDs."""
+        pairs = sorted((s.get("endpoint") or "", s.get("stash_id") or "") for s in stash_ids or ())
+        return hashlib.sha1(json.dumps(pairs).encode()).digest()
+
+    def is_synced(self, entity_id: str, stash_ids: Optional[List[Dict[str, str]]]) -> bool:
+        """Check whether the entity was synced with exactly these StashIDs."""
+        stored = self._hashes.get(entity_id)
+        return stored is not None and stored == self.hash_stash_ids(stash_ids)
+
+    def mark_synced(self, entity_id: str, stash_ids: Optional[List[Dict[str, str]]]) -> None:
+        """Record that the entity has the URLs for these StashIDs."""
+        digest = self.hash_stash_ids(stash_ids)
+        self._hashes[entity_id] = digest
+        self._changed[entity_id] = digest
+
+    def save(self) -> None:
+        """Write recorded changes to disk and close the database."""
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO synced VALUES (?, ?, ?, ?)",
+                [(self.server, self.entity_type, entity_id, digest) for entity_id, digest in self._changed.items()]
+            )
+        self._conn.close()
+        self._changed = {}
+
 
 class StashBoxURLProcessor(ABC):
     """Base class for processing StashBox URLs and adding them to Stash entities."""
 
-    def __init__(self, stash: StashInterface):
+    __slots__ = (
+        "stash", "page_size", "processed_count", "updated_count", "skipped_count", "error_count",
+        "_pending", "_base_cache", "_mutation_cache", "_state", "_bulk_urls",
+    )
+
+    # Set by subclasses: StashBox path segment, find query filter type,
+    # update and bulk update mutations and their input types
+    entity_type: str = ""
+    filter_type: str = ""
+    update_mutation: str = ""
+    update_input_type: str = ""
+    bulk_update_mutation: str = ""
+    bulk_update_input_type: str = ""
+
+    def __init__(self, stash: StashInterface, page_size: int = PAGE_SIZE):
         """
         Initialize the processor with a Stash interface.
 
         Args:
             stash: StashInterface instance for API communication
+            page_size: Number of entities fetched per page
         """
         self.stash = stash
+        self.page_size = page_size
         self.processed_count = 0
         self.updated_count = 0
         self.skipped_count = 0
         self.error_count = 0
+        self._pending: List[tuple] = []
+        # StashBox site URL per GraphQL endpoint
+        self._base_cache: Dict[str, str] = {}
+        # Batch mutation document per batch size
+        self._mutation_cache: Dict[int, str] = {}
+        # Whether updates add URLs server-side through the bulk update mutation
+        self._bulk_urls = False
+        # Entities synced on previous runs, if the state database could be opened
+        self._state: Optional[SyncState] = None
+
+    def get_base_url(self, endpoint: str) -> str:
+        """Return the StashBox site URL for a GraphQL endpoint (strips the /graphql suffix)."""
+        base_url = self._base_cache.get(endpoint)
+        if base_url is None:
+            base_url = endpoint.replace("/graphql", "").rstrip("/")
+            self._base_cache[endpoint] = base_url
+        return base_url
 
-    def construct_stashbox_url(self, endpoint: str, stash_id: str, entity_type: str) -> str:
+    def build_page_urls(self, entities: List[Dict[str, Any]]) -> List[List[str]]:
         """
-        Construct a StashBox URL from endpoint and stash_id.
+        Construct StashBox URLs for every entity on a page in one pass.
 
         Args:
-            endpoint: GraphQL endpoint (e.g., "https://stashdb.org/graphql")
-            stash_id: Entity ID in StashBox (e.g., UUID)
-            entity_type: Type of entity ("scenes" or "performers")
+            entities: Entities with a stash_ids list of {"endpoint": "...", "stash_id": "..."} dicts
 
         Returns:
-            Complete StashBox URL (e.g., "https://stashdb.org/scenes/abc-123")
+            List parallel to entities, each item the entity's StashBox URLs without
+            duplicates (e.g., "https://stashdb.org/scenes/abc-123")
+        """
+        get_base_url = self.get_base_url
+        entity_type = self.entity_type
+        return [
+            list(dict.fromkeys(
+                f"{get_base_url(stash_id_obj['endpoint'])}/{entity_type}/{stash_id_obj['stash_id']}"
+                for stash_id_obj in entity.get("stash_ids") or ()
+                if stash_id_obj.get("endpoint") and stash_id_obj.get("stash_id")
+            ))
+            for entity in entities
+        ]
+
+    def merge_urls(self, existing_urls: Optional[List[str]], new_urls: List[str]) -> List[str]:
+        """
+        Merge existing URLs with new URLs, removing duplicates.
+
+        Args:
+            existing_urls: Current list of URLs (can be None or empty)
+            new_urls: New URLs to add, already free of duplicates
+
+        Returns:
+            Combined list with duplicates removed; existing_urls itself if nothing changed
+        """
+        if not existing_urls:
+            # Nothing to merge with, e.g. a freshly imported entity
+            return new_urls
+
+        # Combine and deduplicate while preserving relative order
+        # Keep existing URLs first, then add new URLs
+        seen = set()
+        combined = []
+        for url in existing_urls:
+            if url not in seen:
+                seen.add(url)
+                combined.append(url)
+        had_duplicates = len(combined) != len(existing_urls)
+        for url in new_urls:
+            if url not in seen:
+                seen.add(url)
+                combined.append(url)
+
+        if not had_duplicates and len(combined) == len(existing_urls):
+            return existing_urls
+        return combined
+
+    def _with_sync_state(
+        self,
+        fetch_page: Callable[[int, int, Optional[int]], List[Dict[str, Any]]],
+        first_page: Optional[List[Dict[str, Any]]] = None
+    ) -> Callable[[int, int, Optional[int]], List[Dict[str, Any]]]:
         """
-        if not endpoint or not stash_id:
-            log.warning(f"Invalid endpoint or stash_id: endpoint={endpoint}, stash_id={stash_id}")
-            return None
+        Wrap a page fetch so that entities whose StashIDs are unchanged since the
+        last sync get urls=None and are skipped.
 
+        StashID endpoints are interned, so each page holds one string per StashBox
+        rather than one per StashID.
+
+        Args:
+            fetch_page: Function taking (page, per_page, after_id) and returning a list of entities
+            first_page: Entities of page 1, if already fetched
+        """
+        def fetch(page: int, per_page: int, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
+            if page == 1 and first_page is not None:
+                entities = first_page
+            else:
+                entities = fetch_page(page, per_page, after_id)
+
+            intern = sys.intern
+            for entity in entities:
+                for stash_id in entity.get("stash_ids") or ():
+                    endpoint = stash_id.get("endpoint")
+                    if endpoint:
+                        stash_id["endpoint"] = intern(endpoint)
+
+            if self._state is not None:
+                for entity in entities:
+                    if self._state.is_synced(entity["id"], entity.get("stash_ids")):
+                        entity["urls"] = None
+
+            return entities
+
+        return fetch
+
+    def query_pages_gql(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run a page query through stash's session, decoding the response with json_loads.
+
+        stashapi always decodes with the standard json module; the pages are large
+        enough for orjson to be worth posting them directly. HTTP and GraphQL errors
+        are raised.
+        """
+        response = self.stash.s.post(self.stash.url, json={"query": query, "variables": variables})
+        response.raise_for_status()
+        result = json_loads(response.content)
+        if result.get("errors"):
+            raise Exception("; ".join(error.get("message", "") for error in result["errors"]))
+        return result["data"]
+
+    def has_input_field(self, type_name: str, field_name: str) -> bool:
+        """Check whether a GraphQL input type has a field. Errors are raised."""
+        result = self.stash.callGQL(INPUT_FIELDS_QUERY, {"name": type_name})
+        fields = (result.get("__type") or {}).get("inputFields") or []
+        return any(field.get("name") == field_name for field in fields)
+
+    def supports_id_filter(self) -> bool:
+        """Check whether the find query filter accepts id, so pages can be selected by ID."""
         try:
-            # Remove /graphql suffix if present
-            base_url = endpoint.replace("/graphql", "").rstrip("/")
-            url = f"{base_url}/{entity_type}/{stash_id}"
-            return url
+            return self.has_input_field(self.filter_type, "id")
         except Exception as e:
-            log.error(f"Error constructing StashBox URL: {str(e)}")
-            return None
+            log.debug(f"Could not inspect {self.filter_type}, fetching {self.entity_type} by page number: {str(e)}")
+            return False
 
-    def extract_urls_from_stashids(self, stash_ids: List[Dict[str, str]], entity_type: str) -> List[str]:
+    def supports_bulk_url_add(self) -> bool:
         """
-        Extract StashBox URLs from a list of stash_id objects.
+        Check whether the bulk update mutation accepts urls, so URLs can be added
+        server-side (mode ADD) instead of sending each entity's merged list.
+        """
+        try:
+            return self.has_input_field(self.bulk_update_input_type, "urls")
+        except Exception as e:
+            log.debug(f"Could not inspect {self.bulk_update_input_type}, using {self.update_mutation}: {str(e)}")
+            return False
+
+    def build_update_mutation(self, count: int) -> str:
+        """
+        Build an aliased mutation document updating several entities in one request.
+        Uses the bulk update mutation when URLs are added server-side.
 
         Args:
-            stash_ids: List of {"endpoint": "...", "stash_id": "..."} dicts
-            entity_type: Type of entity ("scenes" or "performers")
+            count: Number of entities in the batch
 
         Returns:
-            List of constructed StashBox URLs
-        """
-        urls = []
+            Mutation with aliases u0..u{count-1}, taking variables i0..i{count-1}
+        """
+        mutation = self._mutation_cache.get(count)
+        if mutation is None:
+            if self._bulk_urls:
+                name, input_type = self.bulk_update_mutation, self.bulk_update_input_type
+            else:
+                name, input_type = self.update_mutation, self.update_input_type
+            params = ",".join(f"$i{i}:{input_type}!" for i in range(count))
+            fields = " ".join(f"u{i}:{name}(input:$i{i}){{id}}" for i in range(count))
+            mutation = self._mutation_cache[count] = f"mutation BatchUpdate({params}){{{fields}}}"
+        return mutation
+
+    def _open_state(self) -> None:
+        """Open the sync state database; runs without it if that fails."""
+        try:
+            self._state = SyncState(getattr(self.stash, "url", ""), self.entity_type)
+        except Exception as e:
+            log.warning(f"Could not open sync state at {STATE_DB}, checking every entity: {str(e)}")
+            self._state = None
 
-        if not stash_ids:
-            return urls
+    def _save_state(self) -> None:
+        """Persist the sync state, if open."""
+        if self._state is None:
+            return
+        try:
+            self._state.save()
+        except Exception as e:
+            log.warning(f"Could not save sync state to {STATE_DB}: {str(e)}")
+        self._state = None
+
+    def _mark_synced(self, entity_id: str, stash_ids: Optional[List[Dict[str, str]]]) -> None:
+        """Record an entity as synced, if the state database is open."""
+        if self._state is not None:
+            self._state.mark_synced(entity_id, stash_ids)
+
+    def _enqueue_update(
+        self,
+        entity_id: str,
+        merged_urls: List[str],
+        new_urls: List[str],
+        stash_ids: List[Dict[str, str]]
+    ) -> None:
+        """
+        Queue a URL update, sending the queue once it reaches UPDATE_BATCH_SIZE.
+
+        With server-side adds only the StashBox URLs are sent; otherwise the full merged list.
+        """
+        urls = new_urls if self._bulk_urls else merged_urls
+        self._pending.append((entity_id, urls, stash_ids))
+        if len(self._pending) >= UPDATE_BATCH_SIZE:
+            self._flush()
+
+    def _send_updates(self, batch: List[tuple]) -> None:
+        """Send a batch of updates as one request, counting each aliased result."""
+        if self._bulk_urls:
+            variables = {
+                f"i{i}": {"ids": [entity_id], "urls": {"values": urls, "mode": "ADD"}}
+                for i, (entity_id, urls, _) in enumerate(batch)
+            }
+        else:
+            variables = {
+                f"i{i}": {"id": entity_id, "urls": urls}
+                for i, (entity_id, urls, _) in enumerate(batch)
+            }
+        result = self.stash.callGQL(self.build_update_mutation(len(batch)), variables) or {}
+
+        for i, (entity_id, _, stash_ids) in enumerate(batch):
+            if result.get(f"u{i}"):
+                self.updated_count += 1
+                self._mark_synced(entity_id, stash_ids)
+            else:
+                log.error(f"{self.update_mutation} failed for ID {entity_id}")
+                self.error_count += 1
+
+    def _flush(self) -> None:
+        """Send all queued updates. Falls back to one request per entity if the batch fails."""
+        if not self._pending:
+            return
 
-        for stash_id_obj in stash_ids:
-            endpoint = stash_id_obj.get("endpoint")
-            stash_id = stash_id_obj.get("stash_id")
+        batch = self._pending
+        self._pending = []
 
-            url = self.construct_stashbox_url(endpoint, stash_id, entity_type)
-            if url:
-                urls.append(url)
+        try:
+            self._send_updates(batch)
+            return
+        except Exception as e:
+            log.warning(f"Batch update of {len(batch)} {self.entity_type} failed, retrying individually: {str(e)}")
 
-        return urls
+        for item in batch:
+            entity_id = item[0]
+            try:
+                self._send_updates([item])
+            except Exception as e:
+                log.error(f"{self.update_mutation} failed for ID {entity_id}: {str(e)}")
+                self.error_count += 1
 
-    def merge_urls(self, existing_urls: Optional[List[str]], new_urls: List[str]) -> List[str]:
+    def _iter_pages(
+        self,
+        fetch_page: Callable[[int, int, Optional[int]], List[Dict[str, Any]]],
+        per_page: int
+    ) -> Iterator[List[Dict[str, Any]]]:
         """
-        Merge existing URLs with new URLs, removing duplicates.
+        Yield pages of entities in ID order, fetching the next page while the caller
+        processes the current one.
 
-        Args:
-            existing_urls: Current list of URLs (can be None or empty)
-            new_urls: New URLs to add
+        Pages after the first select IDs above the last one seen (keyset pagination),
+        so the server doesn't have to skip over all earlier pages. If the server's
+        filter has no id field, pages are fetched by page number instead.
 
-        Returns:
-            Combined list with duplicates removed
+        Args:
+            fetch_page: Function taking (page, per_page, after_id) and returning a list
+                of entities sorted by ID; after_id None selects by page number
+            per_page: Results per page
         """
-        if existing_urls is None:
-            existing_urls = []
+        # The prefetch thread shares stash's requests session with the updates sent from
+        # this thread; both only send requests, and its connection pool is thread-safe
+        executor = ThreadPoolExecutor(max_workers=1)
+        keyset = self.supports_id_filter()
 
-        # Combine and deduplicate while preserving relative order
-        # Keep existing URLs first, then add new URLs
-        combined = existing_urls.copy()
-        for url in new_urls:
-            if url not in combined:
-                combined.append(url)
+        def fetch(page: int, after_id: Optional[int]) -> List[Dict[str, Any]]:
+            return fetch_page(page, per_page, after_id if keyset else None)
 
-        return combined
+        try:
+            page = 1
+            future = executor.submit(fetch, page, None)
+            while future is not None:
+                entities = future.result()
+
+                # A full page may be followed by more; start fetching it now
+                future = None
+                if entities and len(entities) >= per_page:
+                    page += 1
+                    future = executor.submit(fetch, page, int(entities[-1]["id"]))
+
+                yield entities
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
 
     def get_summary(self) -> Dict[str, int]:
         """Return processing summary statistics."""
@@ -121,10 +452,18 @@ class StashBoxURLProcessor(ABC):
 class SceneProcessor(StashBoxURLProcessor):
     """Processor for adding StashBox URLs to Stash scenes."""
 
-    def __init__(self, stash: StashInterface):
+    __slots__ = ()
+
+    entity_type = "scenes"
+    filter_type = "SceneFilterType"
+    update_mutation = "sceneUpdate"
+    update_input_type = "SceneUpdateInput"
+    bulk_update_mutation = "bulkSceneUpdate"
+    bulk_update_input_type = "BulkSceneUpdateInput"
+
+    def __init__(self, stash: StashInterface, page_size: int = PAGE_SIZE):
         """Initialize with Stash interface."""
-        super().__init__(stash)
-        self.total_scenes_with_stashids = 0
+        super().__init__(stash, page_size)
 
     def process_all(self) -> None:
         """
@@ -133,37 +472,47 @@ class SceneProcessor(StashBoxURLProcessor):
         log.info("Starting StashBox URL processing for scenes...")
 
         try:
-            # Get total count of scenes with StashIDs
-            total_with_stashids = self.get_scene_count_with_stashids()
+            per_page = self.page_size
+
+            # The first page also carries the total count of scenes with StashIDs
+            total_with_stashids, first_page = self.query_scenes_with_stashids(1, per_page, get_count=True)
             log.info(f"Found {total_with_stashids} scenes with StashIDs")
 
             if total_with_stashids == 0:
                 log.info("No scenes with StashIDs found.")
                 return
 
-            # Process in batches (10000 scenes per request for maximum efficiency)
-            per_page = 10000
-            page = 1
+            self._open_state()
+            self._bulk_urls = self.supports_bulk_url_add()
+
+            fetch_page = self._with_sync_state(self.query_scenes_with_stashids, first_page)
+            pages = self._iter_pages(fetch_page, per_page)
 
-            while self.processed_count < total_with_stashids:
-                try:
-                    scenes = self.query_scenes_with_stashids(page, per_page)
+            # Bind hot-loop methods once rather than per entity
+            build_page_urls = self.build_page_urls
+            process_scene = self.process_scene
 
+            try:
+                for scenes in pages:
                     if not scenes:
                         break
 
-                    for scene in scenes:
-                        self.process_scene(scene)
+                    for scene, new_urls in zip(scenes, build_page_urls(scenes)):
+                        process_scene(scene, new_urls)
 
-                    page += 1
+                    # Release this page's scenes before the next page is held as well
+                    scenes.clear()
 
                     # Update progress bar
                     log.progress(self.processed_count / total_with_stashids)
 
-                except Exception as e:
-                    log.error(f"Error processing batch on page {page}: {str(e)}")
-                    self.error_count += 1
-                    break
+            except Exception as e:
+                log.error(f"Error processing scene batches: {str(e)}")
+                self.error_count += 1
+
+            # Send any updates still queued
+            self._flush()
+            self._save_state()
 
             # Print final summary
             summary = self.get_summary()
@@ -177,69 +526,42 @@ class SceneProcessor(StashBoxURLProcessor):
             log.error(f"Fatal error during scene processing: {str(e)}")
             self.error_count += 1
 
-    def get_scene_count_with_stashids(self) -> int:
-        """
-        Get the total count of scenes with StashIDs using GraphQL filter.
-
-        Returns:
-            Total count of scenes with StashIDs
-        """
-        query = """
-            query FindScenes($scene_filter: SceneFilterType) {
-                findScenes(scene_filter: $scene_filter) {
-                    count
-                }
-            }
-        """
-
-        variables = {
-            "scene_filter": {
-                "stash_id_endpoint": {
-                    "modifier": "NOT_NULL"
-                }
-            }
-        }
-
-        try:
-            result = self.stash.callGQL(query, variables)
-
-            if result:
-                count = result.get("findScenes", {}).get("count", 0)
-                log.info(f"Scenes with StashIDs count: {count}")
-                return count
-
-            return 0
-        except Exception as e:
-            log.error(f"Error getting scene count with stashids: {str(e)}")
-            import traceback
-            log.error(f"Traceback: {traceback.format_exc()}")
-            return 0
-
-    def query_scenes_with_stashids(self, page: int, per_page: int) -> List[Dict[str, Any]]:
+    def query_scenes_with_stashids(
+        self,
+        page: int,
+        per_page: int,
+        after_id: Optional[int] = None,
+        get_count: bool = False
+    ) -> Union[List[Dict[str, Any]], Tuple[int, List[Dict[str, Any]]]]:
         """
-        Query scenes that have StashIDs attached using GraphQL filter.
+        Query scenes that have StashIDs attached using GraphQL filter, sorted by ID.
 
         Args:
-            page: Page number (1-indexed)
+            page: Page number (1-indexed), used when after_id is None
             per_page: Results per page
+            after_id: Return scenes with IDs above this instead of selecting by page
+            get_count: Also return the total count of scenes with StashIDs
 
         Returns:
-            List of scene objects with id, urls, and stash_ids
-        """
-        query = """
-            query FindScenes($scene_filter: SceneFilterType, $filter: FindFilterType) {
-                findScenes(scene_filter: $scene_filter, filter: $filter) {
-                    scenes {
+            List of scene objects with id, urls and stash_ids.
+            With get_count, a (count, scenes) tuple.
+        """
+        count_field = "count" if get_count else ""
+        query = minify_query(f"""
+            query FindScenes($scene_filter: SceneFilterType, $filter: FindFilterType) {{
+                findScenes(scene_filter: $scene_filter, filter: $filter) {{
+                    {count_field}
+                    scenes {{
                         id
                         urls
-                        stash_ids {
+                        stash_ids {{
                             endpoint
                             stash_id
-                        }
-                    }
-                }
-            }
-        """
+                        }}
+                    }}
+                }}
+            }}
+        """)
 
         variables = {
             "scene_filter": {
@@ -248,61 +570,40 @@ class SceneProcessor(StashBoxURLProcessor):
                 }
             },
             "filter": {
-                "page": page,
-                "per_page": per_page
+                "page": page if after_id is None else 1,
+                "per_page": per_page,
+                "sort": "id",
+                "direction": "ASC"
             }
         }
+        if after_id is not None:
+            variables["scene_filter"]["id"] = {
+                "value": after_id,
+                "modifier": "GREATER_THAN"
+            }
 
         try:
-            result = self.stash.callGQL(query, variables)
+            result = self.query_pages_gql(query, variables)
 
-            if result:
-                scenes = result.get("findScenes", {}).get("scenes", [])
-                log.info(f"Found {len(scenes)} scenes with StashIDs on page {page}")
-                return scenes if scenes else []
+            result = (result or {}).get("findScenes") or {}
+            scenes = result.get("scenes") or []
+            log.info(f"Found {len(scenes)} scenes with StashIDs on page {page}")
 
-            return []
+            if get_count:
+                return result.get("count", 0), scenes
+            return scenes
         except Exception as e:
             log.error(f"Error querying scenes on page {page}: {str(e)}")
-            import traceback
             log.error(f"Traceback: {traceback.format_exc()}")
             raise
 
-    def update_scene_urls(self, scene_id: str, urls: List[str]) -> None:
+    def process_scene(self, scene: Dict[str, Any], new_urls: List[str]) -> None:
         """
-        Update a scene's URLs using a custom GraphQL mutation.
-
-        Args:
-            scene_id: ID of the scene to update
-            urls: List of URLs to set
-        """
-        mutation = """
-            mutation SceneUpdate($input: SceneUpdateInput!) {
-                sceneUpdate(input: $input) {
-                    id
-                }
-            }
-        """
-
-        variables = {
-            "input": {
-                "id": scene_id,
-                "urls": urls
-            }
-        }
-
-        try:
-            self.stash.callGQL(mutation, variables)
-        except Exception as e:
-            log.error(f"Error updating scene {scene_id} URLs: {str(e)}")
-            raise
-
-    def process_scene(self, scene: Dict[str, Any]) -> None:
-        """
-        Process a single scene: extract StashBox URLs and add them to the scene.
+        Process a single scene: add its StashBox URLs to the scene.
 
         Args:
             scene: Scene object from Stash API
+            new_urls: StashBox URLs built from the scene's StashIDs
         """
         self.processed_count += 1
 
@@ -316,14 +617,18 @@ class SceneProcessor(StashBoxURLProcessor):
                 self.skipped_count += 1
                 return
 
+            if existing_urls is None:
+                # Synced on a previous run with the same StashIDs
+                log.debug(f"Scene {scene_id} already has all StashBox URLs")
+                self._mark_synced(scene_id, stash_ids)
+                self.skipped_count += 1
+                return
+
             if not stash_ids:
                 log.debug(f"Scene {scene_id} has no StashIDs")
                 self.skipped_count += 1
                 return
 
-            # Extract URLs from StashIDs
-            new_urls = self.extract_urls_from_stashids(stash_ids, "scenes")
-
             if not new_urls:
                 log.debug(f"Scene {scene_id} has StashIDs but no valid URLs could be constructed")
                 self.skipped_count += 1
@@ -333,16 +638,15 @@ class SceneProcessor(StashBoxURLProcessor):
             merged_urls = self.merge_urls(existing_urls, new_urls)
 
             # Check if anything changed
-            if merged_urls == existing_urls:
+            if merged_urls is existing_urls:
                 log.debug(f"Scene {scene_id} already has all StashBox URLs")
+                self._mark_synced(scene_id, stash_ids)
                 self.skipped_count += 1
                 return
 
-            # Update scene with merged URLs using custom GraphQL mutation
-            self.update_scene_urls(scene_id, merged_urls)
-
-            self.updated_count += 1
-            log.debug(f"Updated scene {scene_id} with {len(new_urls)} StashBox URL(s)")
+            # Queue scene update; sent in batches of UPDATE_BATCH_SIZE
+            self._enqueue_update(scene_id, merged_urls, new_urls, stash_ids)
+            log.debug(f"Queued update for scene {scene_id} with {len(new_urls)} StashBox URL(s)")
 
         except Exception as e:
             log.error(f"Error processing scene {scene.get('id', 'unknown')}: {str(e)}")
@@ -352,9 +656,18 @@ class SceneProcessor(StashBoxURLProcessor):
 class PerformerProcessor(StashBoxURLProcessor):
     """Processor for adding StashBox URLs to Stash performers."""
 
-    def __init__(self, stash: StashInterface):
+    __slots__ = ()
+
+    entity_type = "performers"
+    filter_type = "PerformerFilterType"
+    update_mutation = "performerUpdate"
+    update_input_type = "PerformerUpdateInput"
+    bulk_update_mutation = "bulkPerformerUpdate"
+    bulk_update_input_type = "BulkPerformerUpdateInput"
+
+    def __init__(self, stash: StashInterface, page_size: int = PAGE_SIZE):
         """Initialize with Stash interface."""
-        super().__init__(stash)
+        super().__init__(stash, page_size)
 
     def process_all(self) -> None:
         """
@@ -363,37 +676,47 @@ class PerformerProcessor(StashBoxURLProcessor):
         log.info("Starting StashBox URL processing for performers...")
 
         try:
-            # Get total count of performers with StashIDs
-            total_with_stashids = self.get_performer_count_with_stashids()
+            per_page = self.page_size
+
+            # The first page also carries the total count of performers with StashIDs
+            total_with_stashids, first_page = self.query_performers_with_stashids(1, per_page, get_count=True)
             log.info(f"Found {total_with_stashids} performers with StashIDs")
 
             if total_with_stashids == 0:
                 log.info("No performers with StashIDs found.")
                 return
 
-            # Process in batches (10000 performers per request for maximum efficiency)
-            per_page = 10000
-            page = 1
+            self._open_state()
+            self._bulk_urls = self.supports_bulk_url_add()
+
+            fetch_page = self._with_sync_state(self.query_performers_with_stashids, first_page)
+            pages = self._iter_pages(fetch_page, per_page)
 
-            while self.processed_count < total_with_stashids:
-                try:
-                    performers = self.query_performers_with_stashids(page, per_page)
+            # Bind hot-loop methods once rather than per entity
+            build_page_urls = self.build_page_urls
+            process_performer = self.process_performer
 
+            try:
+                for performers in pages:
                     if not performers:
                         break
 
-                    for performer in performers:
-                        self.process_performer(performer)
+                    for performer, new_urls in zip(performers, build_page_urls(performers)):
+                        process_performer(performer, new_urls)
 
-                    page += 1
+                    # Release this page's performers before the next page is held as well
+                    performers.clear()
 
                     # Update progress bar
                     log.progress(self.processed_count / total_with_stashids)
 
-                except Exception as e:
-                    log.error(f"Error processing batch on page {page}: {str(e)}")
-                    self.error_count += 1
-                    break
+            except Exception as e:
+                log.error(f"Error processing performer batches: {str(e)}")
+                self.error_count += 1
+
+            # Send any updates still queued
+            self._flush()
+            self._save_state()
 
             # Print final summary
             summary = self.get_summary()
@@ -407,69 +730,42 @@ class PerformerProcessor(StashBoxURLProcessor):
             log.error(f"Fatal error during performer processing: {str(e)}")
             self.error_count += 1
 
-    def get_performer_count_with_stashids(self) -> int:
+    def query_performers_with_stashids(
+        self,
+        page: int,
+        per_page: int,
+        after_id: Optional[int] = None,
+        get_count: bool = False
+    ) -> Union[List[Dict[str, Any]], Tuple[int, List[Dict[str, Any]]]]:
         """
-        Get the total count of performers with StashIDs using GraphQL filter.
-
-        Returns:
-            Total count of performers with StashIDs
-        """
-        query = """
-            query FindPerformers($performer_filter: PerformerFilterType) {
-                findPerformers(performer_filter: $performer_filter) {
-                    count
-                }
-            }
-        """
-
-        variables = {
-            "performer_filter": {
-                "stash_id_endpoint": {
-                    "modifier": "NOT_NULL"
-                }
-            }
-        }
-
-        try:
-            result = self.stash.callGQL(query, variables)
-
-            if result:
-                count = result.get("findPerformers", {}).get("count", 0)
-                log.info(f"Performers with StashIDs count: {count}")
-                return count
-
-            return 0
-        except Exception as e:
-            log.error(f"Error getting performer count with stashids: {str(e)}")
-            import traceback
-            log.error(f"Traceback: {traceback.format_exc()}")
-            return 0
-
-    def query_performers_with_stashids(self, page: int, per_page: int) -> List[Dict[str, Any]]:
-        """
-        Query performers that have StashIDs attached using GraphQL filter.
+        Query performers that have StashIDs attached using GraphQL filter, sorted by ID.
 
         Args:
-            page: Page number (1-indexed)
+            page: Page number (1-indexed), used when after_id is None
             per_page: Results per page
+            after_id: Return performers with IDs above this instead of selecting by page
+            get_count: Also return the total count of performers with StashIDs
 
         Returns:
-            List of performer objects with id, urls, and stash_ids
-        """
-        query = """
-            query FindPerformers($performer_filter: PerformerFilterType, $filter: FindFilterType) {
-                findPerformers(performer_filter: $performer_filter, filter: $filter) {
-                    performers {
+            List of performer objects with id, urls and stash_ids.
+            With get_count, a (count, performers) tuple.
+        """
+        count_field = "count" if get_count else ""
+        query = minify_query(f"""
+            query FindPerformers($performer_filter: PerformerFilterType, $filter: FindFilterType) {{
+                findPerformers(performer_filter: $performer_filter, filter: $filter) {{
+                    {count_field}
+                    performers {{
                         id
                         urls
-                        stash_ids {
+                        stash_ids {{
                             endpoint
                             stash_id
-                        }
-                    }
-                }
-            }
-        """
+                        }}
+                    }}
+                }}
+            }}
+        """)
 
         variables = {
             "performer_filter": {
@@ -478,61 +774,40 @@ class PerformerProcessor(StashBoxURLProcessor):
                 }
             },
             "filter": {
-                "page": page,
-                "per_page": per_page
+                "page": page if after_id is None else 1,
+                "per_page": per_page,
+                "sort": "id",
+                "direction": "ASC"
             }
         }
+        if after_id is not None:
+            variables["performer_filter"]["id"] = {
+                "value": after_id,
+                "modifier": "GREATER_THAN"
+            }
 
         try:
-            result = self.stash.callGQL(query, variables)
+            result = self.query_pages_gql(query, variables)
 
-            if result:
-                performers = result.get("findPerformers", {}).get("performers", [])
-                log.info(f"Found {len(performers)} performers with StashIDs on page {page}")
-                return performers if performers else []
+            result = (result or {}).get("findPerformers") or {}
+            performers = result.get("performers") or []
+            log.info(f"Found {len(performers)} performers with StashIDs on page {page}")
 
-            return []
+            if get_count:
+                return result.get("count", 0), performers
+            return performers
         except Exception as e:
             log.error(f"Error querying performers on page {page}: {str(e)}")
-            import traceback
             log.error(f"Traceback: {traceback.format_exc()}")
             raise
 
-    def update_performer_urls(self, performer_id: str, urls: List[str]) -> None:
-        """
-        Update a performer's URLs using a custom GraphQL mutation.
-
-        Args:
-            performer_id: ID of the performer to update
-            urls: List of URLs to set
-        """
-        mutation = """
-            mutation PerformerUpdate($input: PerformerUpdateInput!) {
-                performerUpdate(input: $input) {
-                    id
-                }
-            }
-        """
-
-        variables = {
-            "input": {
-                "id": performer_id,
-                "urls": urls
-            }
-        }
-
-        try:
-            self.stash.callGQL(mutation, variables)
-        except Exception as e:
-            log.error(f"Error updating performer {performer_id} URLs: {str(e)}")
-            raise
-
-    def process_performer(self, performer: Dict[str, Any]) -> None:
+    def process_performer(self, performer: Dict[str, Any], new_urls: List[str]) -> None:
         """
-        Process a single performer: extract StashBox URLs and add them to the performer.
+        Process a single performer: add its StashBox URLs to the performer.
 
         Args:
             performer: Performer object from Stash API
+            new_urls: StashBox URLs built from the performer's StashIDs
         """
         self.processed_count += 1
 
@@ -546,14 +821,18 @@ class PerformerProcessor(StashBoxURLProcessor):
                 self.skipped_count += 1
                 return
 
+            if existing_urls is None:
+                # Synced on a previous run with the same StashIDs
+                log.debug(f"Performer {performer_id} already has all StashBox URLs")
+                self._mark_synced(performer_id, stash_ids)
+                self.skipped_count += 1
+                return
+
             if not stash_ids:
                 log.debug(f"Performer {performer_id} has no StashIDs")
                 self.skipped_count += 1
                 return
 
-            # Extract URLs from StashIDs
-            new_urls = self.extract_urls_from_stashids(stash_ids, "performers")
-
             if not new_urls:
                 log.debug(f"Performer {performer_id} has StashIDs but no valid URLs could be constructed")
                 self.skipped_count += 1
@@ -563,16 +842,15 @@ class PerformerProcessor(StashBoxURLProcessor):
             merged_urls = self.merge_urls(existing_urls, new_urls)
 
             # Check if anything changed
-            if merged_urls == existing_urls:
+            if merged_urls is existing_urls:
                 log.debug(f"Performer {performer_id} already has all StashBox URLs")
+                self._mark_synced(performer_id, stash_ids)
                 self.skipped_count += 1
                 return
 
-            # Update performer with merged URLs using custom GraphQL mutation
-            self.update_performer_urls(performer_id, merged_urls)
-
-            self.updated_count += 1
-            log.debug(f"Updated performer {performer_id} with {len(new_urls)} StashBox URL(s)")
+            # Queue performer update; sent in batches of UPDATE_BATCH_SIZE
+            self._enqueue_update(performer_id, merged_urls, new_urls, stash_ids)
+            log.debug(f"Queued update for performer {performer_id} with {len(new_urls)} StashBox URL(s)")
 
         except Exception as e:
             log.error(f"Error processing performer {performer.get('id', 'unknown')}: {str(e)}")
@@ -589,6 +867,11 @@ def main():
         server_connection = json_input.get("server_connection")
         args = json_input.get("args", {})
         mode = args.get("mode", "process_scenes")
+        page_size = int(args.get("page_size", PAGE_SIZE))
+        if page_size < 1:
+            # 0 or -1 would have Stash return nothing or everything on every page
+            log.warning(f"Invalid page_size {page_size}, using {PAGE_SIZE}")
+            page_size = PAGE_SIZE
 
         if not server_connection:
             log.error("No server connection provided")
@@ -599,10 +882,10 @@ def main():
 
         # Route to appropriate handler
         if mode == "process_scenes":
-            processor = SceneProcessor(stash)
+            processor = SceneProcessor(stash, page_size)
             processor.process_all()
         elif mode == "process_performers":
-            processor = PerformerProcessor(stash)
+            processor = PerformerProcessor(stash, page_size)
             processor.process_all()
         else:
             log.error(f"Unknown mode: {mode}")
@@ -3,8 +3,10 @@
 Extracts usernames from performer social media URLs and adds them as aliases.
 """
 import json
+import re
 import sys
-from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
 
 try:
     import stashapi.log as log
@@ -15,6 +17,12 @@ except ModuleNotFoundError:
     }))
     sys.exit(1)
 
+# Optional: parse the plugin input and performer pages with orjson when it is installed
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
 # Domains to extract usernames from, with optional extraction config:
 #   strip_prefix: require and remove this prefix from the username (e.g. tiktok.com/@name)
 EXTRACT_DOMAINS = {
@@ -29,39 +37,49 @@ EXTRACT_DOMAINS = {
 }
 
 # Non-username path segments to skip
-SKIP_PATHS = {
+SKIP_PATHS = frozenset({
     'about', 'help', 'login', 'signup', 'settings', 'explore', 'search',
     'home', 'i', 'hashtag', 'compose', 'notifications', 'messages',
     'privacy', 'terms', 'tos', 'support', 'download', 'features',
-}
+})
 
+# Number of performers fetched per request
+PAGE_SIZE = 500
 
-def extract_username_from_url(url):
-    """Parse a single URL and return the extracted username, or None."""
-    parsed = urlparse(url)
-    domain = parsed.netloc.lower().removeprefix('www.')
+# Number of parallel threads for updates
+PARALLEL_WORKERS = 10
+
+# Number of performer updates sent per GraphQL request
+UPDATE_BATCH_SIZE = 50
 
-    config = EXTRACT_DOMAINS.get(domain)
-    if config is None:
-        return None
+# Report progress to Stash at most this many times per pass
+PROGRESS_STEPS = 100
 
-    path = parsed.path.strip('/')
-    if not path:
-        return None
 
-    username = path.split('/')[0]
+def build_username_pattern():
+    """Compile one regex that matches profile URLs on EXTRACT_DOMAINS and captures the username.
 
-    # Some sites prefix usernames with @ in the URL (e.g. tiktok.com/@name)
-    strip_prefix = config.get('strip_prefix')
-    if strip_prefix:
-        if not username.startswith(strip_prefix):
-            return None
-        username = username[len(strip_prefix):]
+    Required prefixes are matched and left out of the capture, and usernames in
+    SKIP_PATHS are rejected by a lookahead, so a single match() does the whole check.
+    """
+    domains = '|'.join(
+        re.escape(domain) + '/+' + re.escape(config.get('strip_prefix', ''))
+        for domain, config in EXTRACT_DOMAINS.items()
+    )
+    skip = '|'.join(re.escape(path) for path in SKIP_PATHS)
+    return re.compile(
+        rf'^https?://(?:www\.)?(?:{domains})(?!(?:{skip})(?:[/?#]|$))([^/?#]+)',
+        re.IGNORECASE
+    )
 
-    if not username or username.lower() in SKIP_PATHS:
-        return None
 
-    return username
+USERNAME_PATTERN = build_username_pattern()
+
+
+def extract_username_from_url(url):
+    """Parse a single URL and return the extracted username, or None."""
+    match = USERNAME_PATTERN.match(url)
+    return match.group(1) if match else None
 
 
 def extract_usernames(urls):
@@ -76,59 +94,120 @@ def extract_usernames(urls):
 
 def deduplicate_aliases(extracted, existing_aliases, performer_name):
     """Case-insensitive dedup against existing aliases, performer name, and self."""
-    seen = set()
+    # Lowercase alias -> first casing seen; insertion order doubles as output order
+    seen = {}
 
     if performer_name:
-        seen.add(performer_name.lower())
+        seen[performer_name.lower()] = performer_name
 
     # Dedup existing aliases (handles pre-existing duplicates in Stash data)
     clean_existing = []
     removed_duplicates = []
     for alias in existing_aliases:
-        lower = alias.lower()
-        if lower not in seen:
-            seen.add(lower)
-            clean_existing.append(alias)
-        else:
+        lower = alias if alias.islower() else alias.lower()
+        if lower in seen:
             removed_duplicates.append(alias)
+        else:
+            seen[lower] = alias
+            clean_existing.append(alias)
 
-    new_aliases = []
+    # Usernames not seen yet are appended to the dict, in order
+    known = len(seen)
     for username in extracted:
-        lower = username.lower()
-        if lower not in seen:
-            seen.add(lower)
-            new_aliases.append(username)
+        seen.setdefault(username if username.islower() else username.lower(), username)
+    new_aliases = list(islice(seen.values(), known, None))
 
     return clean_existing, new_aliases, removed_duplicates
 
 
-def process_performers(stash, dry_run=True):
-    """Fetch all performers, extract usernames from URLs, and add as aliases."""
-    log.info("Fetching performers...")
+def find_performers_paged(stash, fragment):
+    """Find performers with URLs, a page of PAGE_SIZE at a time.
 
-    result = stash.find_performers(
-        f={},
-        fragment="id name urls alias_list",
-        get_count=True
+    Returns (count, performers), where performers is an iterator that only fetches
+    the next page once the previous one has been consumed. Pages are posted through
+    stash's session and decoded with json_loads, since stashapi always uses the
+    standard json module.
+    """
+    query = (
+        'query FindPerformers($filter: FindFilterType, $performer_filter: PerformerFilterType) '
+        f'{{ findPerformers(filter: $filter, performer_filter: $performer_filter) {{ count performers {{ {fragment} }} }} }}'
     )
 
-    if not result:
+    def find(page):
+        variables = {
+            "filter": {"page": page, "per_page": PAGE_SIZE, "sort": "id", "direction": "ASC"},
+            "performer_filter": {"url": {"value": "", "modifier": "NOT_NULL"}},
+        }
+        response = stash.s.post(stash.url, json={"query": query, "variables": variables})
+        response.raise_for_status()
+        result = json_loads(response.content)
+        if result.get("errors"):
+            raise Exception("; ".join(error.get("message", "") for error in result["errors"]))
+        result = result["data"]["findPerformers"]
+        return result["count"], result["performers"]
+
+    count, first_page = find(1)
+
+    def pages():
+        page, performers = 1, first_page
+        while performers:
+            yield from performers
+            if page * PAGE_SIZE >= count:
+                return
+            page += 1
+            performers = find(page)[1]
+
+    return count, pages()
+
+
+def update_performers_batch(stash, updates):
+    """Send several performer updates in one request, as aliased performerUpdate mutations.
+
+    Returns (index, error) for each update that failed. If the combined request fails
+    outright, each performer is retried on its own.
+    """
+    params = ', '.join(f'$i{i}: PerformerUpdateInput!' for i in range(len(updates)))
+    fields = ' '.join(f'u{i}: performerUpdate(input: $i{i}) {{ id }}' for i in range(len(updates)))
+    variables = {f'i{i}': update for i, update in enumerate(updates)}
+
+    try:
+        result = stash.call_GQL(f'mutation BatchUpdate({params}) {{ {fields} }}', variables) or {}
+    except Exception:
+        failures = []
+        for i, update in enumerate(updates):
+            try:
+                stash.update_performer(update)
+            except Exception as e:
+                failures.append((i, e))
+        return failures
+
+    return [(i, 'no result returned') for i in range(len(updates)) if not result.get(f'u{i}')]
+
+
+def process_performers(stash, dry_run=True):
+    """Fetch performers with URLs, extract usernames from them, and add as aliases."""
+    log.info("Fetching performers with URLs...")
+
+    count, performers = find_performers_paged(stash, "id name urls alias_list")
+
+    if not count:
         log.info("No performers found")
         return
 
-    count, performers = result
     log.info(f"Found {count} performers to check")
 
     performers_to_update = []
 
+    progress_step = max(1, count // PROGRESS_STEPS)
     for idx, performer in enumerate(performers):
         urls = performer.get('urls') or []
         existing_aliases = performer.get('alias_list') or []
         name = performer.get('name', '')
 
+        if idx % progress_step == 0:
+            log.progress(idx / count)
+
         if not urls:
-            if count > 0:
-                log.progress((idx + 1) / count)
             continue
 
         extracted = extract_usernames(urls)
@@ -145,8 +224,7 @@ def process_performers(stash, dry_run=True):
                 'removed_duplicates': removed_dupes,
             })
 
-        if count > 0:
-            log.progress((idx + 1) / count)
+    log.progress(1.0)
 
     if not performers_to_update:
         log.info("No changes needed - all usernames already present")
@@ -179,24 +257,37 @@ def process_performers(stash, dry_run=True):
         log.info(f"Run 'Extract Aliases from URLs' to {', '.join(parts)} across {len(performers_to_update)} performers")
         log.info(f"{'=' * 60}")
     else:
-        log.info(f"\nApplying aliases to {len(performers_to_update)} performers...")
+        log.info(f"\nApplying aliases to {len(performers_to_update)} performers using {PARALLEL_WORKERS} workers...")
 
         completed = 0
         failed = 0
         total = len(performers_to_update)
-
-        for p in performers_to_update:
-            try:
-                full_list = p['existing_aliases'] + p['new_aliases']
-                stash.update_performer({
-                    'id': p['id'],
-                    'alias_list': full_list,
-                })
-                completed += 1
-            except Exception as e:
-                log.error(f"Failed to update {p['name']}: {e}")
-                failed += 1
-            log.progress((completed + failed) / total)
+        batches = [
+            performers_to_update[i:i + UPDATE_BATCH_SIZE]
+            for i in range(0, total, UPDATE_BATCH_SIZE)
+        ]
+
+        def update_batch(batch):
+            return update_performers_batch(stash, [
+                {'id': p['id'], 'alias_list': p['existing_aliases'] + p['new_aliases']}
+                for p in batch
+            ])
+
+        progress_step = max(1, len(batches) // PROGRESS_STEPS)
+
+        # The workers share stash's requests session: they only send requests through it,
+        # after its headers and cookies are set up, and its connection pool is thread-safe
+        with ThreadPoolExecutor(max_workers=PARALLEL_WORKERS) as executor:
+            futures = {executor.submit(update_batch, batch): batch for batch in batches}
+            for batches_done, future in enumerate(as_completed(futures), 1):
+                batch = futures[future]
+                failures = future.result()
+                for i, error in failures:
+                    log.error(f"Failed to update {batch[i]['name']}: {error}")
+                failed += len(failures)
+                completed += len(batch) - len(failures)
+                if batches_done % progress_step == 0 or batches_done == len(batches):
+                    log.progress((completed + failed) / total)
 
         log.info(f"{'=' * 60}")
         log.info(f"Added aliases to {completed} performers ({failed} failed)")
@@ -205,7 +296,7 @@ def process_performers(stash, dry_run=True):
 
 def main():
     """Main entry point."""
-    json_input = json.loads(sys.stdin.read())
+    json_input = json_loads(sys.stdin.buffer.read())
 
     server_connection = json_input["server_connection"]
     stash = StashInterface(server_connection)
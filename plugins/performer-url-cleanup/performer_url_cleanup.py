@@ -4,13 +4,28 @@ Normalises, deduplicates, and sorts performer URLs.
 """
 import json
 import sys
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from urllib.parse import urlparse, urlunparse
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+from urllib.parse import urlsplit, urlunsplit
+
+# Number of performers fetched per request
+PAGE_SIZE = 500
 
 # Number of parallel threads for updates
 PARALLEL_WORKERS = 10
 
+# Number of performer updates sent per GraphQL request
+UPDATE_BATCH_SIZE = 50
+
+# Report progress to Stash at most this many times per pass
+PROGRESS_STEPS = 100
+
+# Distinct URLs/domains remembered by the memoised helpers below
+URL_CACHE_SIZE = 100_000
+
 import os
 
 # Debug output paths - written to plugin directory
@@ -28,6 +43,12 @@ except ModuleNotFoundError:
     }))
     sys.exit(1)
 
+# Optional: parse the plugin input and performer pages with orjson when it is installed
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
 # Sites that should not have www prefix
 REMOVE_WWW = {
     'x.com',
@@ -98,155 +119,196 @@ def get_known_domains():
     return known
 
 
-KNOWN_DOMAINS = get_known_domains()
+KNOWN_DOMAINS = frozenset(get_known_domains())
+
+# Known domains with any www. prefix removed, so is_known_domain needs one lookup
+KNOWN_DOMAINS_STRIPPED = frozenset(d[4:] if d.startswith('www.') else d for d in KNOWN_DOMAINS)
+
+# All rules for one domain, as built from the tables above
+Rule = namedtuple(
+    'Rule',
+    'http_only remove_www add_www alias lowercase_path keep_trailing_slash path_transforms path_suffixes',
+    defaults=(False, False, False, None, False, False, (), ()),
+)
+
 
+def build_rules():
+    """Index the rule tables by domain, so normalise_url needs one lookup per domain."""
+    fields = defaultdict(dict)
+    for domain in HTTP_ONLY:
+        fields[domain]['http_only'] = True
+    for domain in REMOVE_WWW:
+        fields[domain]['remove_www'] = True
+    for domain in ADD_WWW:
+        fields[domain]['add_www'] = True
+    for domain, canonical in DOMAIN_ALIASES.items():
+        fields[domain]['alias'] = canonical
+    for domain in LOWERCASE_PATH:
+        fields[domain]['lowercase_path'] = True
+    for domain in KEEP_TRAILING_SLASH:
+        fields[domain]['keep_trailing_slash'] = True
+    for domain, old_prefix, new_prefix in PATH_TRANSFORMS:
+        fields[domain]['path_transforms'] = fields[domain].get('path_transforms', ()) + ((old_prefix, new_prefix),)
+    for domain, suffix in REMOVE_PATH_SUFFIX:
+        fields[domain]['path_suffixes'] = fields[domain].get('path_suffixes', ()) + (suffix,)
+    return {domain: Rule(**rule_fields) for domain, rule_fields in fields.items()}
 
+
+RULES = build_rules()
+NO_RULE = Rule()
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
 def is_known_domain(domain):
     """Check if domain has explicit rules configured."""
     d = domain.lower()
-    if d in KNOWN_DOMAINS:
-        return True
-    if d.startswith('www.') and d[4:] in KNOWN_DOMAINS:
-        return True
-    return False
+    if d.startswith('www.'):
+        d = d[4:]
+    return d in KNOWN_DOMAINS_STRIPPED
 
 
+@lru_cache(maxsize=URL_CACHE_SIZE)
 def normalise_url(url):
     """Normalise a URL according to site-specific rules.
 
     Returns (normalised_url, canonical_domain) tuple.
     """
-    # Ensure URL has a scheme before parsing (urlparse needs it to identify netloc)
+    # Ensure URL has a scheme before parsing (urlsplit needs it to identify netloc)
     if not url.startswith(('http://', 'https://')):
         url = 'https://' + url
 
     # Parse the URL
-    parsed = urlparse(url)
+    parsed = urlsplit(url)
 
-    # Normalise domain (need this early to check HTTP_ONLY)
+    # Normalise domain; rule always holds the rules for the current domain
     domain = parsed.netloc.lower()
+    rule = RULES.get(domain, NO_RULE)
 
     # Upgrade to HTTPS unless site doesn't support it
-    scheme = 'http' if domain in HTTP_ONLY else 'https'
+    scheme = 'http' if rule.http_only else 'https'
 
     # Remove www if site doesn't use it
     if domain.startswith('www.'):
-        domain_without_www = domain[4:]
-        if domain_without_www in REMOVE_WWW:
-            domain = domain_without_www
+        bare_rule = RULES.get(domain[4:], NO_RULE)
+        if bare_rule.remove_www:
+            domain = domain[4:]
+            rule = bare_rule
 
     # Add www if site requires it
-    if not domain.startswith('www.') and domain in ADD_WWW:
+    if rule.add_www:
         domain = 'www.' + domain
+        rule = RULES.get(domain, NO_RULE)
 
     # Apply domain aliases
-    if domain in DOMAIN_ALIASES:
-        domain = DOMAIN_ALIASES[domain]
+    if rule.alias:
+        domain = rule.alias
+        rule = RULES.get(domain, NO_RULE)
 
     # Handle path
     path = parsed.path
 
     # Apply path transformations
-    for transform_domain, old_prefix, new_prefix in PATH_TRANSFORMS:
-        if domain == transform_domain and path.startswith(old_prefix):
+    for old_prefix, new_prefix in rule.path_transforms:
+        if path.startswith(old_prefix):
             path = new_prefix + path[len(old_prefix):]
             break
 
     # Remove path suffixes
-    for suffix_domain, suffix in REMOVE_PATH_SUFFIX:
-        if domain == suffix_domain and path.endswith(suffix):
+    for suffix in rule.path_suffixes:
+        if path.endswith(suffix):
             path = path[:-len(suffix)]
             break
 
     # Remove trailing slash (unless site requires it)
-    if path.endswith('/') and domain not in KEEP_TRAILING_SLASH:
+    if path.endswith('/') and not rule.keep_trailing_slash:
         path = path.rstrip('/')
 
     # Case handling - only lowercase if site is known to be case-insensitive
-    if domain in LOWERCASE_PATH:
+    if rule.lowercase_path:
         path = path.lower()
 
     # Reconstruct URL (preserve query string, drop fragment)
-    normalised = urlunparse((scheme, domain, path, parsed.params, parsed.query, ''))
+    normalised = urlunsplit((scheme, domain, path, parsed.query, ''))
+
+    # Interned, so URLs/domains shared by many performers are stored once
+    return sys.intern(normalised), sys.intern(domain)
+
 
-    return normalised, domain
+# A performer whose URLs need changing, with the results of deduplicate_and_sort
+PerformerUpdate = namedtuple(
+    'PerformerUpdate',
+    'id name old_urls new_urls changes potential_changes url_norms'
+)
 
 
 def write_debug_files(performers_to_update):
-    """Write debug output files for analysis."""
+    """Write debug output files for analysis.
+
+    Each file's lines are collected in a list and written with a single write call.
+    """
+    separator = '=' * 60
+
     # Per-performer output (confirmed changes only)
+    lines = []
+    for p in performers_to_update:
+        if not p.changes:
+            continue
+        lines.append(f"{separator}\n")
+        lines.append(f"Performer: {p.name} (ID: {p.id})\n")
+        lines.append(f"{separator}\n")
+        lines.append("Original URLs:\n")
+        lines.extend(f"  {url}\n" for url in p.old_urls)
+        lines.append("\nChanges:\n")
+        lines.extend(f"  - {change}\n" for change in p.changes)
+        lines.append("\nFinal URLs:\n")
+        lines.extend(f"  {url}\n" for url in p.new_urls)
+        lines.append("\n")
+
     with open(DEBUG_BY_PERFORMER, 'w', encoding='utf-8') as f:
-        for p in performers_to_update:
-            if not p['changes']:
-                continue
-            f.write(f"{'=' * 60}\n")
-            f.write(f"Performer: {p['name']} (ID: {p['id']})\n")
-            f.write(f"{'=' * 60}\n")
-            f.write("Original URLs:\n")
-            for url in p['old_urls']:
-                f.write(f"  {url}\n")
-            f.write("\nChanges:\n")
-            for change in p['changes']:
-                f.write(f"  - {change}\n")
-            f.write("\nFinal URLs:\n")
-            for url in p['new_urls']:
-                f.write(f"  {url}\n")
-            f.write("\n")
-
-    # Per-domain output - group confirmed changes by domain
-    domain_changes = defaultdict(list)
+        f.write(''.join(lines))
+
+    # Collect normalisations as (domain, performer, original, normalised) rows: known
+    # domains are confirmed changes, unknown ones potential changes (reuses the
+    # results from deduplicate_and_sort)
+    domain_changes = []
+    potential_changes = []
     for p in performers_to_update:
-        for url in p['old_urls']:
-            normalised, domain = normalise_url(url)
-            if normalised != url and is_known_domain(domain):
-                domain_changes[domain].append({
-                    'performer': p['name'],
-                    'original': url,
-                    'normalised': normalised
-                })
+        for url, normalised, domain, known in p.url_norms:
+            if normalised != url:
+                rows = domain_changes if known else potential_changes
+                rows.append((domain, p.name, url, normalised))
+
+    def domain_lines(rows, label):
+        # Stable sort, so each domain's changes keep their performer order
+        rows.sort(key=itemgetter(0))
+        lines = []
+        for domain, group in groupby(rows, key=itemgetter(0)):
+            changes = [f"[{name}]\n  {original}\n  -> {normalised}\n" for _, name, original, normalised in group]
+            lines.append(f"{separator}\n")
+            lines.append(f"Domain: {domain} ({len(changes)} {label})\n")
+            lines.append(f"{separator}\n")
+            lines.extend(changes)
+            lines.append("\n")
+        return lines
 
     with open(DEBUG_BY_DOMAIN, 'w', encoding='utf-8') as f:
-        for domain in sorted(domain_changes.keys()):
-            changes = domain_changes[domain]
-            f.write(f"{'=' * 60}\n")
-            f.write(f"Domain: {domain} ({len(changes)} changes)\n")
-            f.write(f"{'=' * 60}\n")
-            for c in changes:
-                f.write(f"[{c['performer']}]\n")
-                f.write(f"  {c['original']}\n")
-                f.write(f"  -> {c['normalised']}\n")
-            f.write("\n")
+        f.write(''.join(domain_lines(domain_changes, "changes")))
 
     # Potential changes - unknown domains grouped by domain
-    potential_by_domain = defaultdict(list)
-    for p in performers_to_update:
-        for url in p['old_urls']:
-            normalised, domain = normalise_url(url)
-            if normalised != url and not is_known_domain(domain):
-                potential_by_domain[domain].append({
-                    'performer': p['name'],
-                    'original': url,
-                    'normalised': normalised
-                })
+    lines = [
+        "POTENTIAL CHANGES - Unknown domains (review and add rules as needed)\n",
+        f"{separator}\n\n",
+    ]
+    lines.extend(domain_lines(potential_changes, "potential changes"))
 
     with open(DEBUG_POTENTIAL, 'w', encoding='utf-8') as f:
-        f.write("POTENTIAL CHANGES - Unknown domains (review and add rules as needed)\n")
-        f.write(f"{'=' * 60}\n\n")
-        for domain in sorted(potential_by_domain.keys()):
-            changes = potential_by_domain[domain]
-            f.write(f"{'=' * 60}\n")
-            f.write(f"Domain: {domain} ({len(changes)} potential changes)\n")
-            f.write(f"{'=' * 60}\n")
-            for c in changes:
-                f.write(f"[{c['performer']}]\n")
-                f.write(f"  {c['original']}\n")
-                f.write(f"  -> {c['normalised']}\n")
-            f.write("\n")
+        f.write(''.join(lines))
 
 
+@lru_cache(maxsize=URL_CACHE_SIZE)
 def has_mixed_case(url):
     """Check if URL path has mixed case (likely from scraper, more accurate)."""
-    parsed = urlparse(url)
+    parsed = urlsplit(url)
     path = parsed.path
     return path != path.lower() and path != path.upper()
 
@@ -255,19 +317,23 @@ def deduplicate_and_sort(urls):
     """Normalise, deduplicate, and sort URLs.
 
     Only applies changes to known domains. Unknown domain changes go to potential list.
-    Returns (new_urls, changes, potential_changes).
+    Returns (new_urls, changes, potential_changes, url_norms), where url_norms holds
+    (original_url, normalised_url, domain, is_known) for each input URL.
     """
     if not urls:
-        return [], [], []
+        return [], [], [], []
 
     changes = []
     potential_changes = []
+    url_norms = []
     seen = {}  # normalised_lower -> (normalised_url, original_url, domain, is_known)
 
     for url in urls:
         normalised, domain = normalise_url(url)
-        normalised_lower = normalised.lower()
+        # Most normalised URLs are already lowercase; skip the copy for those
+        normalised_lower = normalised if normalised.islower() else normalised.lower()
         known = is_known_domain(domain)
+        url_norms.append((url, normalised, domain, known))
 
         if normalised_lower in seen:
             # Duplicate found - prefer mixed case version (likely from scraper)
@@ -295,69 +361,130 @@ def deduplicate_and_sort(urls):
                 else:
                     potential_changes.append(msg)
 
-    # Build result - only apply normalisations for known domains
-    result_urls = []
-    for normalised, original, domain, known in seen.values():
+    # Build result - only apply normalisations for known domains - alongside each
+    # URL's (domain, lowercase URL) sort key. Normalised URLs already have a
+    # lowercase domain, so only unknown-domain originals need parsing.
+    keyed = []
+    in_order = True
+    for normalised_lower, (normalised, original, domain, known) in seen.items():
         if known:
-            result_urls.append(normalised)
+            url = normalised
+            key = (domain, normalised_lower)
         else:
-            result_urls.append(original)  # Keep original for unknown domains
+            url = original  # Keep original for unknown domains
+            key = (urlsplit(original).netloc.lower(), original.lower())
+        if in_order and keyed and key < keyed[-1][0]:
+            in_order = False
+        keyed.append((key, url))
+
+    # Sort by domain, then full URL (stable, so ties keep their original order).
+    # URLs that are already in order are left as they are.
+    if not in_order:
+        keyed.sort(key=itemgetter(0))
+        changes.append("Reordered URLs alphabetically by domain")
+    sorted_urls = [url for _, url in keyed]
 
-    # Sort by domain, then full URL
-    def sort_key(url):
-        parsed = urlparse(url)
-        return (parsed.netloc.lower(), url.lower())
+    return sorted_urls, changes, potential_changes, url_norms
 
-    sorted_urls = sorted(result_urls, key=sort_key)
 
-    # Check if order changed (result_urls preserves original order after dedup)
-    if result_urls != sorted_urls:
-        changes.append("Reordered URLs alphabetically by domain")
+def find_performers_paged(stash, fragment):
+    """Find performers with URLs, a page of PAGE_SIZE at a time.
+
+    Returns (count, performers), where performers is an iterator that only fetches
+    the next page once the previous one has been consumed. Pages are posted through
+    stash's session and decoded with json_loads, since stashapi always uses the
+    standard json module.
+    """
+    query = (
+        'query FindPerformers($filter: FindFilterType, $performer_filter: PerformerFilterType) '
+        f'{{ findPerformers(filter: $filter, performer_filter: $performer_filter) {{ count performers {{ {fragment} }} }} }}'
+    )
+
+    def find(page):
+        variables = {
+            "filter": {"page": page, "per_page": PAGE_SIZE, "sort": "id", "direction": "ASC"},
+            "performer_filter": {"url": {"value": "", "modifier": "NOT_NULL"}},
+        }
+        response = stash.s.post(stash.url, json={"query": query, "variables": variables})
+        response.raise_for_status()
+        result = json_loads(response.content)
+        if result.get("errors"):
+            raise Exception("; ".join(error.get("message", "") for error in result["errors"]))
+        result = result["data"]["findPerformers"]
+        return result["count"], result["performers"]
+
+    count, first_page = find(1)
+
+    def pages():
+        page, performers = 1, first_page
+        while performers:
+            yield from performers
+            if page * PAGE_SIZE >= count:
+                return
+            page += 1
+            performers = find(page)[1]
+
+    return count, pages()
+
+
+def update_performers_batch(stash, updates):
+    """Send several performer updates in one request, as aliased performerUpdate mutations.
+
+    Returns (index, error) for each update that failed. If the combined request fails
+    outright, each performer is retried on its own.
+    """
+    params = ', '.join(f'$i{i}: PerformerUpdateInput!' for i in range(len(updates)))
+    fields = ' '.join(f'u{i}: performerUpdate(input: $i{i}) {{ id }}' for i in range(len(updates)))
+    variables = {f'i{i}': update for i, update in enumerate(updates)}
+
+    try:
+        result = stash.call_GQL(f'mutation BatchUpdate({params}) {{ {fields} }}', variables) or {}
+    except Exception:
+        failures = []
+        for i, update in enumerate(updates):
+            try:
+                stash.update_performer(update)
+            except Exception as e:
+                failures.append((i, e))
+        return failures
 
-    return sorted_urls, changes, potential_changes
+    return [(i, 'no result returned') for i in range(len(updates)) if not result.get(f'u{i}')]
 
 
 def process_performers(stash, dry_run=True, write_debug=False):
     """Process all performers and clean up their URLs."""
-    # Fetch all performers with URLs
+    # Fetch only performers that have URLs; the rest have nothing to clean
     log.info("Fetching performers with URLs...")
 
-    result = stash.find_performers(
-        f={},
-        fragment="id name urls",
-        get_count=True
-    )
+    count, performers = find_performers_paged(stash, "id name urls")
 
-    if not result:
+    if not count:
         log.info("No performers found")
         return
 
-    count, performers = result
     log.info(f"Found {count} performers to check")
 
     performers_to_update = []
 
+    progress_step = max(1, count // PROGRESS_STEPS)
     for idx, performer in enumerate(performers):
+        if idx % progress_step == 0:
+            log.progress(idx / count)
+
         urls = performer.get('urls') or []
 
         if not urls:
             continue
 
-        new_urls, changes, potential_changes = deduplicate_and_sort(urls)
+        new_urls, changes, potential_changes, url_norms = deduplicate_and_sort(urls)
 
         if changes or potential_changes:
-            performers_to_update.append({
-                'id': performer['id'],
-                'name': performer['name'],
-                'old_urls': urls,
-                'new_urls': new_urls,
-                'changes': changes,
-                'potential_changes': potential_changes,
-            })
-
-        # Update progress
-        if count > 0:
-            log.progress((idx + 1) / count)
+            performers_to_update.append(PerformerUpdate(
+                performer['id'], performer['name'], urls, new_urls,
+                changes, potential_changes, url_norms
+            ))
+
+    log.progress(1.0)
 
     # Report results
     if not performers_to_update:
@@ -365,8 +492,8 @@ def process_performers(stash, dry_run=True, write_debug=False):
         return
 
     # Filter to only performers with confirmed changes
-    performers_with_changes = [p for p in performers_to_update if p['changes']]
-    performers_with_potential = [p for p in performers_to_update if p['potential_changes']]
+    performers_with_changes = [p for p in performers_to_update if p.changes]
+    performers_with_potential = [p for p in performers_to_update if p.potential_changes]
 
     log.info(f"Found {len(performers_with_changes)} performers with confirmed changes")
     log.info(f"Found {len(performers_with_potential)} performers with potential changes")
@@ -382,11 +509,11 @@ def process_performers(stash, dry_run=True, write_debug=False):
         log.info(f"{'=' * 60}\n")
 
         for p in performers_with_changes:
-            log.info(f"Performer: {p['name']} (ID: {p['id']})")
-            for change in p['changes']:
+            log.info(f"Performer: {p.name} (ID: {p.id})")
+            for change in p.changes:
                 log.info(f"  - {change}")
             log.info(f"  Final URLs:")
-            for url in p['new_urls']:
+            for url in p.new_urls:
                 log.info(f"    - {url}")
 
     if dry_run:
@@ -405,24 +532,31 @@ def process_performers(stash, dry_run=True, write_debug=False):
         completed = 0
         failed = 0
         total = len(performers_with_changes)
+        batches = [
+            performers_with_changes[i:i + UPDATE_BATCH_SIZE]
+            for i in range(0, total, UPDATE_BATCH_SIZE)
+        ]
+
+        def update_batch(batch):
+            return update_performers_batch(stash, [{'id': p.id, 'urls': p.new_urls} for p in batch])
 
-        def update_performer(p):
-            stash.update_performer({'id': p['id'], 'urls': p['new_urls']})
-            return p['name']
+        progress_step = max(1, len(batches) // PROGRESS_STEPS)
 
+        # The workers share stash's requests session: they only send requests through it,
+        # after its headers and cookies are set up, and its connection pool is thread-safe
         with ThreadPoolExecutor(max_workers=PARALLEL_WORKERS) as executor:
-            futures = {executor.submit(update_performer, p): p for p in performers_with_changes}
-            for future in as_completed(futures):
-                p = futures[future]
-                try:
-                    future.result()
-                    completed += 1
-                    if completed % 100 == 0 or completed == total:
-                        log.info(f"Progress: {completed}/{total} performers updated")
-                except Exception as e:
-                    log.error(f"Failed to update {p['name']}: {e}")
-                    failed += 1
-                log.progress((completed + failed) / total)
+            futures = {executor.submit(update_batch, batch): batch for batch in batches}
+            for batches_done, future in enumerate(as_completed(futures), 1):
+                batch = futures[future]
+                failures = future.result()
+                for i, error in failures:
+                    log.error(f"Failed to update {batch[i].name}: {error}")
+                failed += len(failures)
+                completed += len(batch) - len(failures)
+                if batches_done % 10 == 0 or batches_done == len(batches):
+                    log.info(f"Progress: {completed}/{total} performers updated")
+                if batches_done % progress_step == 0 or batches_done == len(batches):
+                    log.progress((completed + failed) / total)
 
         log.info(f"{'=' * 60}")
         log.info(f"Applied URL cleanup to {completed} performers ({failed} failed)")
@@ -432,7 +566,7 @@ def process_performers(stash, dry_run=True, write_debug=False):
 def main():
     """Main entry point."""
     # Read JSON input from Stash
-    json_input = json.loads(sys.stdin.read())
+    json_input = json_loads(sys.stdin.buffer.read())
 
     # Extract connection info and initialise client
     server_connection = json_input["server_connection"]
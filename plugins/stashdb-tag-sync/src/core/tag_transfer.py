@@ -1,36 +1,50 @@
 """Core tag transfer logic for plugin."""
+import asyncio
 import logging
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
-from models import Tag, Config
+from models import Tag, Config, ExistingTag
 from stash_client import StashClient
 
 
 log = logging.getLogger(__name__)
 
 
-def _merge_tag_data(stashdb_tag: Tag, existing_tag: dict, ignored_aliases: list[str] = None) -> Tag:
+def _clean_aliases(aliases, ignored_set: frozenset[str] = frozenset()) -> set[str]:
+    """Strip aliases in one pass, dropping non-strings, empty values and ignored aliases."""
+    cleaned = set()
+    for alias in aliases or ():
+        if isinstance(alias, str):
+            alias = alias.strip()
+            if alias and (not ignored_set or alias.lower() not in ignored_set):
+                cleaned.add(alias)
+    return cleaned
+
+
+def _existing_aliases(existing_tag: ExistingTag) -> set[str]:
+    """Return a Stash tag's stripped, non-empty aliases, cached on the tag."""
+    if existing_tag.alias_set is None:
+        existing_tag.alias_set = _clean_aliases(existing_tag.aliases)
+    return existing_tag.alias_set
+
+
+def _merge_tag_data(stashdb_tag: Tag, existing_tag: ExistingTag, ignored_set: frozenset[str] = frozenset()) -> Tag:
     """Merge StashDB tag with existing Stash tag, combining aliases and keeping best description.
 
     Args:
         stashdb_tag: Tag from StashDB
-        existing_tag: Tag dict from local Stash
-        ignored_aliases: List of aliases to exclude from merge
+        existing_tag: Existing tag from local Stash
+        ignored_set: Lowercased aliases to exclude from merge
     """
-    if ignored_aliases is None:
-        ignored_aliases = []
-
-    ignored_set = set(a.lower() for a in ignored_aliases)
-
     # Merge aliases: union of both sets, excluding ignored aliases
-    existing_aliases = set(a.strip() for a in (existing_tag.get('aliases') or [])
-                          if isinstance(a, str) and a.strip() and a.strip().lower() not in ignored_set)
-    stashdb_aliases = set(a.strip() for a in (stashdb_tag.aliases or [])
-                         if isinstance(a, str) and a.strip() and a.strip().lower() not in ignored_set)
-    merged_aliases = sorted(list(existing_aliases | stashdb_aliases))
+    existing_aliases = _existing_aliases(existing_tag)
+    if ignored_set:
+        existing_aliases = set(a for a in existing_aliases if a.lower() not in ignored_set)
+    stashdb_aliases = _clean_aliases(stashdb_tag.aliases, ignored_set)
+    merged_aliases = sorted(existing_aliases | stashdb_aliases)
 
     # For description: prefer StashDB if non-empty, otherwise keep Stash's
-    existing_desc = (existing_tag.get('description') or "").strip()
+    existing_desc = (existing_tag.description or "").strip()
     stashdb_desc = (stashdb_tag.description or "").strip()
     merged_desc = stashdb_desc if stashdb_desc else existing_desc
 
@@ -44,71 +58,89 @@ def _merge_tag_data(stashdb_tag: Tag, existing_tag: dict, ignored_aliases: list[
     )
 
 
-def _has_alias_conflicts(merged_tag: Tag, existing_tags_by_name: dict, ignored_aliases: list[str] = None) -> list[str]:
+def _has_alias_conflicts(merged_tag: Tag, existing_tags_by_name: dict, ignored_set: frozenset[str] = frozenset()) -> list[str]:
     """Check if merged tag's aliases conflict with existing tag names.
 
+    Merged aliases are already stripped, and existing_tags_by_name is keyed by lowercase name.
     Returns list of conflicting aliases that already exist as tag names.
     """
-    if ignored_aliases is None:
-        ignored_aliases = []
+    aliases_lower = [alias.lower() for alias in merged_tag.aliases]
 
-    ignored_set = set(a.lower() for a in ignored_aliases)
-    conflicts = []
+    # Usually nothing conflicts; one set check settles that without walking the aliases again
+    if existing_tags_by_name.keys().isdisjoint(aliases_lower):
+        return []
 
-    for alias in merged_tag.aliases:
-        alias_lower = alias.lower().strip()
-        if alias_lower and alias_lower not in ignored_set and alias_lower in existing_tags_by_name:
-            conflicts.append(alias)
+    return [
+        alias for alias, alias_lower in zip(merged_tag.aliases, aliases_lower)
+        if alias_lower and alias_lower not in ignored_set and alias_lower in existing_tags_by_name
+    ]
 
-    return conflicts
 
+def _diff_and_merge(stashdb_tag: Tag, existing_tag: ExistingTag, ignored_set: frozenset[str] = frozenset()) -> tuple[Tag, bool]:
+    """Merge a StashDB tag into an existing Stash tag and check whether Stash needs updating.
 
-def _is_tag_out_of_sync(stashdb_tag: Tag, existing_tag: dict, ignored_aliases: list[str] = None) -> bool:
-    """Check if a tag differs from Stash after merging (compares merged description, aliases, and stash_ids)."""
-    merged = _merge_tag_data(stashdb_tag, existing_tag, ignored_aliases)
+    Returns (merged_tag, out_of_sync), where out_of_sync is True if the merged description,
+    aliases or stash_ids differ from what Stash has.
+    """
+    merged = _merge_tag_data(stashdb_tag, existing_tag, ignored_set)
 
-    existing_desc = (existing_tag.get('description') or "").strip()
+    existing_desc = (existing_tag.description or "").strip()
     merged_desc = (merged.description or "").strip()
     if existing_desc != merged_desc:
-        log.debug(f"  Description differs for '{stashdb_tag.name}':")
-        log.debug(f"    Stash: '{existing_desc}'")
-        log.debug(f"    Merged: '{merged_desc}'")
-        return True
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("  Description differs for '%s':", stashdb_tag.name)
+            log.debug("    Stash: '%s'", existing_desc)
+            log.debug("    Merged: '%s'", merged_desc)
+        return merged, True
 
     # Normalise aliases: strip whitespace and deduplicate
-    existing_aliases = set(a.strip() for a in (existing_tag.get('aliases') or []) if isinstance(a, str) and a.strip())
-    merged_aliases = set(merged.aliases)
-    if existing_aliases != merged_aliases:
-        log.debug(f"  Aliases differ for '{stashdb_tag.name}':")
-        log.debug(f"    Stash: {existing_aliases}")
-        log.debug(f"    Merged: {merged_aliases}")
-        return True
+    # merged.aliases is already deduplicated, so equal sizes plus containment means
+    # equal sets - without building a set from the merged list
+    existing_aliases = _existing_aliases(existing_tag)
+    if len(existing_aliases) != len(merged.aliases) or not existing_aliases.issuperset(merged.aliases):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("  Aliases differ for '%s':", stashdb_tag.name)
+            log.debug("    Stash: %s", existing_aliases)
+            log.debug("    Merged: %s", set(merged.aliases))
+        return merged, True
 
     # Check if StashDB stash_id needs to be added
     if stashdb_tag.stash_id:
-        existing_stash_ids = existing_tag.get('stash_ids', []) or []
-        existing_stash_id_set = {item.get('stash_id') if isinstance(item, dict) else getattr(item, 'stash_id', None)
-                                for item in existing_stash_ids}
-        if stashdb_tag.stash_id not in existing_stash_id_set:
-            log.debug(f"  StashDB ID {stashdb_tag.stash_id} missing from '{stashdb_tag.name}'")
-            return True
+        existing_stash_ids = existing_tag.stash_ids
+        if not any(
+            item['stash_id'] == stashdb_tag.stash_id
+            for item in existing_stash_ids
+        ):
+            log.debug("  StashDB ID %s missing from '%s'", stashdb_tag.stash_id, stashdb_tag.name)
+            return merged, True
 
-    return False
+    return merged, False
 
 
 async def transfer_tags_graphql(
     client: StashClient,
     tags: List[Tag],
-    config: Config
+    config: Config,
+    use_cache: bool = False,
+    existing_tags: Optional[Tuple[Dict[str, ExistingTag], Dict[str, ExistingTag]]] = None
 ) -> dict:
     """Transfer tags via three-stage matching: stash_id, then name, then create new.
 
+    Args:
+        client: Connected StashClient instance
+        tags: Tags fetched from StashDB
+        config: Sync configuration
+        use_cache: Reuse Stash's tags from the previous run if none have changed since
+        existing_tags: Result of client.find_existing_tags_with_data(), if already fetched
+
     Returns:
         Dictionary with transfer statistics (created, updated, skipped, failed)
     """
     log.info(f"Starting transfer of {len(tags)} tags to Stash")
 
-    existing_tags_by_name, existing_tags_by_stash_id = await client.find_existing_tags_with_data()
+    if existing_tags is None:
+        existing_tags = await client.find_existing_tags_with_data(use_cache=use_cache)
+    existing_tags_by_name, existing_tags_by_stash_id = existing_tags
     log.info(f"Found {len(existing_tags_by_name)} existing tags in Stash")
 
     matched_tags: set = set()
@@ -116,96 +148,124 @@ async def transfer_tags_graphql(
     skipped_tags = 0
     failed_tags = 0
 
-    # Stage 1: Match by stash_id (most reliable)
+    # Lowercased once here rather than on every merge and conflict check
+    ignored_set = frozenset(a.lower() for a in config.ignored_aliases)
+
+    def queue_update(tag: Tag, existing_tag: ExistingTag, matched_by: str) -> bool:
+        """Queue an update for a matched tag if it is out of sync; returns True if queued."""
+        nonlocal failed_tags
+        merged_tag, out_of_sync = _diff_and_merge(tag, existing_tag, ignored_set)
+        if not out_of_sync:
+            log.debug("  Matched '%s' by %s - in sync", tag.name, matched_by)
+            return False
+
+        # Check for alias conflicts before updating
+        conflicts = _has_alias_conflicts(merged_tag, existing_tags_by_name, ignored_set)
+        if conflicts:
+            log.warning(f"Cannot update '{tag.name}' - aliases {conflicts} already exist as tag names")
+            failed_tags += 1
+            return False
+
+        tags_to_update.append((existing_tag.id, merged_tag, existing_tag.stash_ids, tag.stash_id))
+        log.debug("  Matched '%s' by %s - needs update", tag.name, matched_by)
+        return True
+
+    # Stage 1: Match by stash_id (most reliable). Tags without a stash_id match are
+    # kept for stage 2, along with their lowercased name, so the tag list is only
+    # walked (and each name lowercased) once.
     log.info("Stage 1: Matching tags by stash_id...")
     stage1_matches = 0
+    unmatched_tags = []
     for tag in tags:
-        if tag.stash_id and tag.stash_id in existing_tags_by_stash_id:
-            if not tag.name or not tag.name.strip():
-                log.warning(f"Tag with stash_id {tag.stash_id} has no name - skipping to prevent invalid update")
-                skipped_tags += 1
-                continue
-
-            existing_tag = existing_tags_by_stash_id[tag.stash_id]
-            if _is_tag_out_of_sync(tag, existing_tag, config.ignored_aliases):
-                merged_tag = _merge_tag_data(tag, existing_tag, config.ignored_aliases)
-
-                # Check for alias conflicts before updating
-                conflicts = _has_alias_conflicts(merged_tag, existing_tags_by_name, config.ignored_aliases)
-                if conflicts:
-                    log.warning(f"Cannot update '{tag.name}' - aliases {conflicts} already exist as tag names")
-                    failed_tags += 1
-                else:
-                    tags_to_update.append((existing_tag['id'], merged_tag, existing_tag.get('stash_ids', []), tag.stash_id))
-                    log.debug(f"  Matched '{tag.name}' by stash_id {tag.stash_id} - needs update")
-                    stage1_matches += 1
-            else:
-                log.debug(f"  Matched '{tag.name}' by stash_id {tag.stash_id} - in sync")
-            matched_tags.add(tag.name.lower())
+        name_lower = tag.name.lower() if tag.name else ''
+        existing_tag = existing_tags_by_stash_id.get(tag.stash_id) if tag.stash_id else None
+        if existing_tag is None:
+            unmatched_tags.append((tag, name_lower))
+            continue
+
+        if not name_lower.strip():
+            log.warning(f"Tag with stash_id {tag.stash_id} has no name - skipping to prevent invalid update")
+            skipped_tags += 1
+            unmatched_tags.append((tag, name_lower))
+            continue
+
+        if queue_update(tag, existing_tag, f"stash_id {tag.stash_id}"):
+            stage1_matches += 1
+        matched_tags.add(name_lower)
 
     log.info(f"Stage 1: Found {stage1_matches} tags to update by stash_id")
 
     # Stage 2: Match remaining tags by name and description/aliases (case-insensitive)
     log.info("Stage 2: Matching remaining tags by name...")
     stage2_matches = 0
-    for tag in tags:
-        if tag.name and tag.name.lower() not in matched_tags:
-            if tag.name.lower() in existing_tags_by_name:
-                existing_tag = existing_tags_by_name[tag.name.lower()]
-                if _is_tag_out_of_sync(tag, existing_tag, config.ignored_aliases):
-                    merged_tag = _merge_tag_data(tag, existing_tag, config.ignored_aliases)
-
-                    # Check for alias conflicts before updating
-                    conflicts = _has_alias_conflicts(merged_tag, existing_tags_by_name, config.ignored_aliases)
-                    if conflicts:
-                        log.warning(f"Cannot update '{tag.name}' - aliases {conflicts} already exist as tag names")
-                        failed_tags += 1
-                    else:
-                        tags_to_update.append((existing_tag['id'], merged_tag, existing_tag.get('stash_ids', []), tag.stash_id))
-                        log.debug(f"  Matched '{tag.name}' by name - needs update")
-                        stage2_matches += 1
-                else:
-                    log.debug(f"  Matched '{tag.name}' by name - in sync")
-                matched_tags.add(tag.name.lower())
+    for tag, name_lower in unmatched_tags:
+        if name_lower and name_lower not in matched_tags:
+            existing_tag = existing_tags_by_name.get(name_lower)
+            if existing_tag is not None:
+                if queue_update(tag, existing_tag, "name"):
+                    stage2_matches += 1
+                matched_tags.add(name_lower)
 
     log.info(f"Stage 2: Found {stage2_matches} tags to update by name")
 
     new_tags = [
-        tag for tag in tags
-        if tag.name and tag.name.lower() not in matched_tags
+        (tag, name_lower) for tag, name_lower in unmatched_tags
+        if name_lower and name_lower not in matched_tags
     ]
 
-    created_count = 0
     log.info(f"Stage 3: Creating {len(new_tags)} new tags")
     if new_tags:
         # Idempotency check: warn if any new tag names already exist (shouldn't happen, but safety check)
-        for tag in new_tags:
-            if tag.name.lower() in existing_tags_by_name:
+        for tag, name_lower in new_tags:
+            if name_lower in existing_tags_by_name:
                 log.warning(f"Tag '{tag.name}' already exists but wasn't matched - skipping to prevent duplicate")
-                new_tags.remove(tag)
+        new_tags = [tag for tag, name_lower in new_tags if name_lower not in existing_tags_by_name]
 
-        if new_tags:
-            created_ids = await client.create_tags_batch(new_tags)
-            created_count = len(created_ids)
-            log.info(f"Successfully created {created_count} new tags")
-        else:
+        if not new_tags:
             log.info("All new tags already exist")
     else:
         log.info("No new tags to create")
 
-    updated_count = 0
-    update_failed_count = 0
-    if tags_to_update:
+    # Aliases must not collide with the names of tags about to be created either
+    if new_tags and tags_to_update:
+        new_tags_by_name = {tag.name.lower(): tag for tag in new_tags}
+        checked_updates = []
+        for update in tags_to_update:
+            merged_tag = update[1]
+            conflicts = _has_alias_conflicts(merged_tag, new_tags_by_name, ignored_set)
+            if conflicts:
+                log.warning(f"Cannot update '{merged_tag.name}' - aliases {conflicts} are new tag names")
+                failed_tags += 1
+            else:
+                checked_updates.append(update)
+        tags_to_update = checked_updates
+
+    async def create_new_tags() -> int:
+        """Create the new tags, returning how many were created."""
+        if not new_tags:
+            return 0
+        created_ids = await client.create_tags_batch(new_tags)
+        log.info(f"Successfully created {len(created_ids)} new tags")
+        return len(created_ids)
+
+    async def update_matched_tags() -> int:
+        """Update the matched tags, returning how many were updated."""
+        if not tags_to_update:
+            log.info("No tags to update")
+            return 0
         log.info(f"Updating {len(tags_to_update)} matched tags...")
-        updated_count = await client.update_tags_batch(tags_to_update, progress=None, task_id=None)
-        update_failed_count = len(tags_to_update) - updated_count
+        updated = await client.update_tags_batch(tags_to_update, progress=None, task_id=None)
 
-        if updated_count == len(tags_to_update):
-            log.info(f"Successfully updated {updated_count} tags")
+        if updated == len(tags_to_update):
+            log.info(f"Successfully updated {updated} tags")
         else:
-            log.warning(f"Updated {updated_count} of {len(tags_to_update)} tags ({update_failed_count} failed)")
-    else:
-        log.info("No tags to update")
+            log.warning(f"Updated {updated} of {len(tags_to_update)} tags ({len(tags_to_update) - updated} failed)")
+        return updated
+
+    # New and matched tags are disjoint, and no update adds an alias that a new tag
+    # takes as its name, so creating and updating can overlap
+    created_count, updated_count = await asyncio.gather(create_new_tags(), update_matched_tags())
+    update_failed_count = len(tags_to_update) - updated_count
 
     log.info("Tag transfer completed successfully")
 
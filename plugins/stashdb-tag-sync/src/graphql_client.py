@@ -4,22 +4,69 @@ Fetches tag information directly from the StashDB.org GraphQL endpoint.
 """
 import logging
 import requests
+import sys
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Dict, Optional
 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 from models import Tag
 
+# Optional: faster JSON (de)serialisation with orjson when it is installed
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
 logger = logging.getLogger(__name__)
 
+TAG_URL_PREFIX = "https://stashdb.org/tags/"
+
+# Fields fetched for each tag
+TAG_FIELDS = """{
+    id
+    name
+    description
+    aliases
+    deleted
+    category {
+        id
+        name
+        group
+        description
+    }
+}"""
+
+# Selection for one page of queryTags results
+TAG_PAGE_FIELDS = f"{{ count tags {TAG_FIELDS} }}"
+
+FIND_TAG_QUERY = f"""
+query FindTag($name: String, $id: ID) {{
+    findTag(name: $name, id: $id) {TAG_FIELDS}
+}}
+"""
+
 
 class StashDBClient:
     """Client for interacting with StashDB GraphQL API."""
 
     CACHE_EXPIRY_HOURS = 24
+    MAX_RETRIES = 3  # Attempts per request before giving up
+    CACHE_MAX_AGE_HOURS = 24 * 7  # Expired caches are re-validated by tag count up to this age
     CACHE_DIR = Path.home() / '.cache' / 'stash-tag-scraper'
     CACHE_FILE = CACHE_DIR / 'tags.json'
+    PAGES_PER_REQUEST = 5  # Pages of tags requested in one GraphQL document
+    PAGE_FETCH_WORKERS = 8  # Requests for pages of tags run at once
 
     def __init__(self, endpoint: str = "https://stashdb.org/graphql", api_key: str = None):
         """Initialize StashDB client with endpoint and API key."""
@@ -37,21 +84,46 @@ class StashDBClient:
             'Content-Type': 'application/json'
         }
 
+        # One session for all requests, so connections to StashDB are kept alive and reused.
+        # query_all_tags' page workers share it too; they only send requests through it,
+        # and its connection pool is thread-safe.
+        # Transient failures (connection errors, timeouts, 429 and 5xx responses) are retried
+        # with exponential backoff by the transport, honouring any Retry-After header.
+        retry = Retry(
+            total=self.MAX_RETRIES - 1,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset({'POST'}),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount('https://', HTTPAdapter(max_retries=retry))
+        self.session.mount('http://', HTTPAdapter(max_retries=retry))
+
     def _get_cache_file(self) -> Optional[dict]:
         """Load tags from cache if valid (not expired)."""
         if not self.CACHE_FILE.exists():
             return None
 
         try:
-            with open(self.CACHE_FILE, 'r') as f:
-                cache = json.load(f)
+            with open(self.CACHE_FILE, 'rb') as f:
+                cache = json_loads(f.read())
 
             # Check if cache is expired
             cache_time = cache.get('timestamp', 0)
             age_hours = (time.time() - cache_time) / 3600
             if age_hours > self.CACHE_EXPIRY_HOURS:
-                logger.debug(f"Cache expired ({age_hours:.1f}h old)")
-                return None
+                if not self._is_cache_current(cache):
+                    logger.debug(f"Cache expired ({age_hours:.1f}h old)")
+                    return None
+
+                # Nothing added or removed on StashDB since; keep the cache for another period
+                logger.info("StashDB tag count unchanged, reusing cached tags")
+                tags = cache.get('tags', [])
+                self._save_cache_file(tags, cache['count'], cache['fetched'])
+                return tags
 
             logger.info(f"Using cached tags ({age_hours:.1f}h old)")
             return cache.get('tags', [])
@@ -60,16 +132,47 @@ class StashDBClient:
             logger.warning(f"Failed to read cache: {e}")
             return None
 
-    def _save_cache_file(self, tags: List[dict]) -> None:
-        """Save tags to cache with timestamp."""
+    def _is_cache_current(self, cache: dict) -> bool:
+        """Check whether an expired cache still matches StashDB's tag count.
+
+        This costs a single one-tag request instead of a full download. The count only
+        changes when tags are added or removed, so edits to existing tags (or an addition
+        and a deletion that cancel out) go unnoticed until the cache is downloaded again.
+        Caches without a stored count, or first downloaded more than CACHE_MAX_AGE_HOURS
+        ago, are never treated as current, so such changes are at most a week late.
+        """
+        count = cache.get('count')
+        fetched = cache.get('fetched')
+        if count is None or fetched is None:
+            return False
+        if (time.time() - fetched) / 3600 > self.CACHE_MAX_AGE_HOURS:
+            return False
+
+        try:
+            return self._query_tags_pages([1], 1)[0]['count'] == count
+        except Exception as e:
+            logger.debug(f"Failed to check StashDB tag count: {e}")
+            return False
+
+    def _save_cache_file(self, tags: List[dict], count: Optional[int] = None, fetched: Optional[float] = None) -> None:
+        """Save tags to cache with timestamp.
+
+        Args:
+            tags: Raw tag dicts to cache
+            count: Total tag count reported by StashDB, used to re-validate the cache once expired
+            fetched: Time the tags were downloaded, if earlier than now
+        """
         try:
             self.CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            now = time.time()
             cache = {
-                'timestamp': time.time(),
+                'timestamp': now,
+                'fetched': fetched or now,
+                'count': count,
                 'tags': tags
             }
-            with open(self.CACHE_FILE, 'w') as f:
-                json.dump(cache, f)
+            with open(self.CACHE_FILE, 'wb') as f:
+                f.write(json_dumps(cache))
             logger.debug(f"Saved {len(tags)} tags to cache")
         except Exception as e:
             logger.warning(f"Failed to save cache: {e}")
@@ -84,43 +187,28 @@ class StashDBClient:
             logger.debug("Cache file not found")
 
     def _execute_query(self, query: str, variables: Optional[Dict] = None) -> Dict:
-        """Execute a GraphQL query with retry logic for transient errors."""
+        """Execute a GraphQL query; transient errors are retried by the session's adapter."""
         payload = {'query': query}
         if variables:
             payload['variables'] = variables
 
-        max_retries = 3
-        base_delay = 1
-
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(
-                    self.endpoint,
-                    json=payload,
-                    headers=self.headers,
-                    timeout=60
-                )
-                response.raise_for_status()
-
-                result = response.json()
-
-                if 'errors' in result:
-                    error_messages = [err.get('message', str(err)) for err in result['errors']]
-                    raise ValueError(f"GraphQL errors: {', '.join(error_messages)}")
-
-                return result.get('data', {})
-
-            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
-                if attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt)
-                    logger.warning(f"Transient error (attempt {attempt + 1}/{max_retries}): {e}. Retrying in {delay}s...")
-                    time.sleep(delay)
-                else:
-                    logger.error(f"Request failed after {max_retries} attempts: {e}")
-                    raise
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Request failed: {e}")
-                raise
+        try:
+            response = self.session.post(
+                self.endpoint,
+                data=json_dumps(payload),
+                timeout=60
+            )
+            response.raise_for_status()
+            result = json_loads(response.content)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Request failed: {e}")
+            raise
+
+        if 'errors' in result:
+            error_messages = [err.get('message', str(err)) for err in result['errors']]
+            raise ValueError(f"GraphQL errors: {', '.join(error_messages)}")
+
+        return result.get('data', {})
 
     def query_all_tags(self, use_cache: bool = True) -> List[Tag]:
         """Fetch all tags from StashDB using pagination.
@@ -136,92 +224,95 @@ class StashDBClient:
                 logger.info(f"Loaded {len(tags)} tags from cache")
                 return tags
 
-        query = """
-        query QueryTags($input: TagQueryInput!) {
-            queryTags(input: $input) {
-                count
-                tags {
-                    id
-                    name
-                    description
-                    aliases
-                    deleted
-                    category {
-                        id
-                        name
-                        group
-                        description
-                    }
-                }
-            }
-        }
-        """
-
         per_page: int = 100
-        all_tags = []
-        all_tag_dicts = []  # Store raw dicts for caching
-        page = 1
-        total_count = None
 
         logger.info("Fetching tags from StashDB")
 
-        while True:
-            variables = {
-                'input': {
-                    'page': page,
-                    'per_page': per_page,
-                    'sort': 'NAME',
-                    'direction': 'ASC'
-                }
-            }
+        # The first page gives the total count; the remaining pages are then
+        # requested PAGES_PER_REQUEST at a time, with those requests run concurrently
+        first_page = self._query_tags_pages([1], per_page)[0]
+        total_count = first_page['count']
+        total_pages = max(1, -(-total_count // per_page))
+        logger.debug(f"Fetching {total_count} tags total ({total_pages} pages)")
+
+        pages = [first_page['tags']]
+        page_groups = [
+            list(range(start, min(start + self.PAGES_PER_REQUEST, total_pages + 1)))
+            for start in range(2, total_pages + 1, self.PAGES_PER_REQUEST)
+        ]
+        if page_groups:
+            with ThreadPoolExecutor(max_workers=self.PAGE_FETCH_WORKERS) as executor:
+                for results in executor.map(lambda group: self._query_tags_pages(group, per_page), page_groups):
+                    pages.extend(result['tags'] for result in results)
+
+        # Filter out deleted tags, keeping the raw dicts for caching
+        all_tag_dicts = [tag for tags in pages for tag in tags if not tag.get('deleted', False)]
+        all_tags = [self._tag_from_graphql(tag) for tag in all_tag_dicts]
 
-            try:
-                data = self._execute_query(query, variables)
+        logger.info(f"Successfully fetched {len(all_tags)} active tags")
+        # Save to cache
+        self._save_cache_file(all_tag_dicts, total_count)
+        return all_tags
 
-                if 'queryTags' not in data:
-                    raise ValueError("Invalid StashDB response: missing 'queryTags' field")
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _build_tags_query(page_count: int) -> str:
+        """Build a query document with one aliased queryTags selection (p0, p1, ...) per page.
 
-                result = data['queryTags']
+        Only a couple of page counts are ever used, so each document is built once.
+        """
+        params = ', '.join(f'$p{i}: TagQueryInput!' for i in range(page_count))
+        fields = ' '.join(f'p{i}: queryTags(input: $p{i}) {TAG_PAGE_FIELDS}' for i in range(page_count))
+        return f'query QueryTags({params}) {{ {fields} }}'
 
-                if 'tags' not in result or 'count' not in result:
-                    raise ValueError("Invalid StashDB response: missing 'tags' or 'count' in queryTags")
+    def _query_tags_pages(self, pages: List[int], per_page: int) -> List[Dict]:
+        """Fetch several pages of tags in one request, returning each page's queryTags result ({count, tags}).
 
-                tags = result['tags']
-                if total_count is None:
-                    total_count = result['count']
-                    logger.debug(f"Fetching {total_count} tags total")
+        If StashDB rejects a multi-page request (e.g. as too complex), the pages are
+        fetched one request at a time instead.
+        """
+        variables = {
+            f'p{i}': {
+                'page': page,
+                'per_page': per_page,
+                'sort': 'NAME',
+                'direction': 'ASC'
+            }
+            for i, page in enumerate(pages)
+        }
 
-                # Filter out deleted tags and convert to Tag objects
-                active_tags = [
-                    self._tag_from_graphql(tag)
-                    for tag in tags
-                    if not tag.get('deleted', False)
-                ]
-                # Store non-deleted dicts for caching
-                all_tag_dicts.extend([tag for tag in tags if not tag.get('deleted', False)])
-                all_tags.extend(active_tags)
-                logger.debug(f"Fetched {len(all_tags)} tags so far")
+        try:
+            data = self._execute_query(self._build_tags_query(len(pages)), variables)
 
-                # Check if we've fetched all tags (last page has fewer items)
-                if len(tags) < per_page:
-                    break
+            results = []
+            for i in range(len(pages)):
+                result = data.get(f'p{i}')
+                if result is None:
+                    raise ValueError("Invalid StashDB response: missing 'queryTags' field")
 
-                page += 1
+                if 'tags' not in result or 'count' not in result:
+                    raise ValueError("Invalid StashDB response: missing 'tags' or 'count' in queryTags")
 
-            except Exception as e:
-                logger.error(f"Failed to fetch page {page}: {e}")
-                raise
+                results.append(result)
 
-        logger.info(f"Successfully fetched {len(all_tags)} active tags")
-        # Save to cache
-        self._save_cache_file(all_tag_dicts)
-        return all_tags
+            logger.debug(f"Fetched pages {pages[0]}-{pages[-1]}")
+            return results
+
+        except Exception as e:
+            if len(pages) > 1:
+                logger.warning(f"Failed to fetch pages {pages[0]}-{pages[-1]} together ({e}), fetching one at a time")
+                return [self._query_tags_pages([page], per_page)[0] for page in pages]
+            logger.error(f"Failed to fetch page {pages[0]}: {e}")
+            raise
 
     def _tag_from_graphql(self, tag_data: Dict) -> Tag:
         """Convert GraphQL tag response to Tag object."""
         category_name = None
         if tag_data.get('category'):
             category_name = tag_data['category'].get('name')
+            if category_name:
+                # Many tags share a category; keep one copy of each name
+                category_name = sys.intern(category_name)
 
         stash_id = tag_data['id']
 
@@ -231,7 +322,7 @@ class StashDBClient:
             stash_id=stash_id,
             aliases=tag_data.get('aliases', []),
             category=category_name,
-            url=f"https://stashdb.org/tags/{stash_id}"
+            url=TAG_URL_PREFIX + stash_id
         )
 
     def _tag_from_graphql_dict(self, tag_data: Dict) -> Tag:
@@ -240,24 +331,6 @@ class StashDBClient:
 
     def find_tag(self, name: Optional[str] = None, tag_id: Optional[str] = None) -> Optional[Tag]:
         """Find a tag by name or ID."""
-        query = """
-        query FindTag($name: String, $id: ID) {
-            findTag(name: $name, id: $id) {
-                id
-                name
-                description
-                aliases
-                deleted
-                category {
-                    id
-                    name
-                    group
-                    description
-                }
-            }
-        }
-        """
-
         variables = {}
         if name:
             variables['name'] = name
@@ -268,7 +341,7 @@ class StashDBClient:
             raise ValueError("Either name or tag_id must be provided")
 
         try:
-            data = self._execute_query(query, variables)
+            data = self._execute_query(FIND_TAG_QUERY, variables)
             tag = data.get('findTag')
 
             if tag and not tag.get('deleted', False):
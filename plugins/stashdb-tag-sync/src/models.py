@@ -3,7 +3,7 @@ from dataclasses import dataclass
 from typing import Optional
 
 
-@dataclass
+@dataclass(slots=True)
 class Tag:
     """Represents a tag from StashDB."""
     name: str
@@ -40,7 +40,18 @@ class Tag:
         )
 
 
-@dataclass
+@dataclass(slots=True)
+class ExistingTag:
+    """Represents a tag already in the local Stash instance."""
+    id: str
+    name: str
+    description: Optional[str]
+    aliases: list[str]
+    stash_ids: list[dict]  # {'endpoint': ..., 'stash_id': ...} dicts
+    alias_set: Optional[set[str]] = None  # Stripped aliases, filled in on first use during transfer
+
+
+@dataclass(slots=True)
 class StashConnection:
     """Configuration for connecting to a local Stash instance via GraphQL."""
     scheme: str = "http"
@@ -61,7 +72,7 @@ class StashConnection:
 
 
 
-@dataclass
+@dataclass(slots=True)
 class Config:
     """Configuration for the stash tag scraper."""
     stashdb_api_key: str
@@ -1,25 +1,45 @@
 """Stash GraphQL Client wrapper providing async interface for tag operations."""
+import asyncio
+import hashlib
 import logging
+from functools import lru_cache
+from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 from stash_graphql_client import StashContext
 from stash_graphql_client.types import Tag as GraphQLTag
 
-from models import StashConnection, Tag
-from stash_graphql_mutations import UPDATE_TAG_STASH_IDS_MUTATION
+from graphql_client import json_dumps, json_loads
+from models import ExistingTag, StashConnection, Tag
+from stash_graphql_mutations import LATEST_TAG_UPDATE_QUERY, UPDATE_TAG_MUTATION
 
 logger = logging.getLogger(__name__)
 
+STASHDB_ENDPOINT = 'https://stashdb.org/graphql'
+
 
 class StashClient:
     """Wrapper around stash-graphql-client providing clean async interface for tag operations."""
 
-    def __init__(self, connection: Optional[StashConnection] = None):
-        """Initialize StashClient with optional Stash connection details."""
+    # Number of tags created per aliased tagCreate request
+    CREATE_BATCH_SIZE = 25
+    EXISTING_TAGS_PAGE_SIZE = 500  # Tags per page when fetching existing tags
+    PAGE_FETCH_WORKERS = 8  # Pages of existing tags fetched at once
+    CACHE_DIR = Path.home() / '.cache' / 'stash-tag-scraper'
+    EXISTING_TAGS_CACHE_FILE = CACHE_DIR / 'existing-tags.json'
+
+    def __init__(self, connection: Optional[StashConnection] = None, max_concurrency: int = 10):
+        """Initialize StashClient with optional Stash connection details.
+
+        Args:
+            connection: Stash connection details (defaults to localhost)
+            max_concurrency: Maximum number of mutations in flight at once
+        """
         if connection is None:
             connection = StashConnection()
 
         self.connection = connection
+        self.max_concurrency = max_concurrency
         self.context = StashContext(conn=connection.to_connection_dict())
         self.graphql_client = None
 
@@ -54,48 +74,66 @@ class StashClient:
             )
 
             # Convert to lowercase name -> ID mapping
-            tag_map: Dict[str, str] = {}
-            for tag in result.tags:
-                if hasattr(tag, 'name') and hasattr(tag, 'id'):
-                    tag_map[tag.name.lower()] = tag.id
-
-            return tag_map
+            return {tag.name.lower(): tag.id for tag in result.tags}
 
         except Exception as e:
             logger.error(f"Failed to find existing tags: {e}")
             return {}
 
-    async def find_existing_tags_with_data(self):
-        """Find all existing tags with full data, returns ({name: tag_data}, {stash_id: tag_data})."""
+    async def find_existing_tags_with_data(
+        self,
+        use_cache: bool = False
+    ) -> Tuple[Dict[str, ExistingTag], Dict[str, ExistingTag]]:
+        """Find all existing tags with full data, returns ({lowercase_name: tag}, {stash_id: tag}).
+
+        Args:
+            use_cache: Reuse the tags saved by a previous run if Stash's tags haven't changed since
+        """
         try:
             if self.graphql_client is None:
                 raise RuntimeError("GraphQL client not initialised. Did you forget async context manager?")
 
-            # Fetch all tags from Stash
-            result = await self.graphql_client.find_tags(
-                filter_={"per_page": -1}  # Get all tags
-            )
-
-            # Convert to lowercase name -> tag data mapping, also build stash_id index
-            tag_map: Dict[str, Dict] = {}
-            stash_id_map: Dict[str, Dict] = {}
-
-            for tag in result.tags:
-                if hasattr(tag, 'name') and hasattr(tag, 'id'):
-                    tag_data = {
+            records = None
+            cache_key = None
+            if use_cache:
+                cache_key = await self._existing_tags_cache_key()
+                if cache_key:
+                    records = self._load_existing_tags_cache(cache_key)
+                    if records is not None:
+                        logger.info(f"Using cached Stash tags ({len(records)} tags)")
+
+            if records is None:
+                records = [
+                    {
                         'id': tag.id,
                         'name': tag.name,
-                        'description': getattr(tag, 'description', None),
-                        'aliases': getattr(tag, 'aliases', []) or [],
-                        'stash_ids': getattr(tag, 'stash_ids', []) or []
+                        'description': tag.description,
+                        'aliases': tag.aliases or [],
+                        'stash_ids': [
+                            {'endpoint': item.endpoint, 'stash_id': item.stash_id}
+                            for item in tag.stash_ids or []
+                        ]
                     }
-                    tag_map[tag.name.lower()] = tag_data
+                    for tag in await self._fetch_all_tags()
+                ]
+
+                if cache_key:
+                    self._save_existing_tags_cache(cache_key, records)
+
+            # Convert to lowercase name -> tag mapping, also build stash_id index.
+            # Both maps share the same ExistingTag instances.
+            tag_map: Dict[str, ExistingTag] = {}
+            stash_id_map: Dict[str, ExistingTag] = {}
 
-                    # Also index by stash_ids if they exist
-                    stash_ids = getattr(tag, 'stash_ids', []) or []
-                    for stash_id_obj in stash_ids:
-                        if hasattr(stash_id_obj, 'stash_id') and stash_id_obj.stash_id:
-                            stash_id_map[stash_id_obj.stash_id] = tag_data
+            for record in records:
+                tag_data = ExistingTag(**record)
+                tag_map[tag_data.name.lower()] = tag_data
+
+                # Also index by stash_ids if they exist
+                for item in tag_data.stash_ids:
+                    stash_id = item['stash_id']
+                    if stash_id:
+                        stash_id_map[stash_id] = tag_data
 
             return tag_map, stash_id_map
 
@@ -103,6 +141,76 @@ class StashClient:
             logger.error(f"Failed to find existing tags with data: {e}")
             return {}, {}
 
+    async def _fetch_all_tags(self) -> list:
+        """Fetch every tag in Stash, a page at a time.
+
+        The first page reports the total count; the remaining pages are then
+        fetched concurrently, at most PAGE_FETCH_WORKERS at once.
+        """
+        per_page = self.EXISTING_TAGS_PAGE_SIZE
+        semaphore = asyncio.Semaphore(self.PAGE_FETCH_WORKERS)
+
+        async def fetch_page(page: int):
+            async with semaphore:
+                return await self.graphql_client.find_tags(
+                    filter_={"page": page, "per_page": per_page, "sort": "id", "direction": "ASC"}
+                )
+
+        first = await fetch_page(1)
+        total_pages = -(-first.count // per_page)
+
+        tags = list(first.tags)
+        for result in await asyncio.gather(*(fetch_page(page) for page in range(2, total_pages + 1))):
+            tags.extend(result.tags)
+        return tags
+
+    async def _existing_tags_cache_key(self) -> Optional[str]:
+        """Identify the current state of Stash's tags, for validating the existing tags cache.
+
+        The key combines the Stash address, the tag count and the most recent tag update
+        time, so creating, editing or deleting any tag changes it. Costs a single one-tag query.
+        Returns None (don't use the cache) if the update time can't be read.
+        """
+        try:
+            result = (await self.graphql_client.execute(LATEST_TAG_UPDATE_QUERY, {}))['findTags']
+        except Exception as e:
+            logger.debug("Failed to query Stash tag count: %s", e)
+            return None
+
+        latest = result['tags'][0].get('updated_at') if result['tags'] else None
+        if not latest:
+            return None
+
+        conn = self.connection
+        state = f"{conn.scheme}://{conn.host}:{conn.port}|{result['count']}|{latest}"
+        return hashlib.sha256(state.encode('utf-8')).hexdigest()
+
+    def _load_existing_tags_cache(self, key: str) -> Optional[List[dict]]:
+        """Load cached tag records if they were saved under the given key."""
+        try:
+            with open(self.EXISTING_TAGS_CACHE_FILE, 'rb') as f:
+                cache = json_loads(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to read existing tags cache: {e}")
+            return None
+
+        if cache.get('key') != key:
+            logger.debug("Stash tags changed since last run, ignoring cache")
+            return None
+        return cache.get('tags')
+
+    def _save_existing_tags_cache(self, key: str, records: List[dict]) -> None:
+        """Save tag records under the given key."""
+        try:
+            self.CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            with open(self.EXISTING_TAGS_CACHE_FILE, 'wb') as f:
+                f.write(json_dumps({'key': key, 'tags': records}))
+            logger.debug("Saved %d existing tags to cache", len(records))
+        except Exception as e:
+            logger.warning(f"Failed to save existing tags cache: {e}")
+
     async def create_tags_batch(self, tags: List[Tag]) -> Dict[str, str]:
         """Create multiple tags, returns {lowercase_name: tag_id}."""
         try:
@@ -113,13 +221,17 @@ class StashClient:
                 return {}
 
             created_tags: Dict[str, str] = {}
+            semaphore = asyncio.Semaphore(self.max_concurrency)
 
+            valid_tags = []
             for tag in tags:
-                try:
-                    if not tag.name or not tag.name.strip():
-                        logger.warning(f"Skipping tag with empty name")
-                        continue
+                if not tag.name or not tag.name.strip():
+                    logger.warning(f"Skipping tag with empty name")
+                else:
+                    valid_tags.append(tag)
 
+            async def create_one(tag: Tag) -> None:
+                try:
                     graphql_tag = GraphQLTag(name=tag.name)
 
                     if tag.description:
@@ -127,7 +239,8 @@ class StashClient:
                     if tag.aliases:
                         graphql_tag.aliases = tag.aliases
 
-                    created = await self.graphql_client.create_tag(graphql_tag)
+                    async with semaphore:
+                        created = await self.graphql_client.create_tag(graphql_tag)
 
                     if hasattr(created, 'id') and created.id:
                         created_tags[tag.name.lower()] = created.id
@@ -137,7 +250,46 @@ class StashClient:
 
                 except Exception as e:
                     logger.error(f"Failed to create tag '{tag.name}': {e}")
-                    continue
+
+            async def create_chunk(chunk: List[Tag]) -> None:
+                mutation, variables = self._build_batched_create_mutation(chunk)
+                try:
+                    async with semaphore:
+                        result = await self.graphql_client.execute(mutation, variables)
+                except Exception as e:
+                    # Retry one at a time so a single bad tag doesn't sink the whole chunk.
+                    # The failed request may still have created some of the tags, so look
+                    # those up by name first and only retry the rest.
+                    logger.warning(f"Batched create of {len(chunk)} tags failed, creating individually: {e}")
+                    async with semaphore:
+                        found = await self._find_tag_ids_by_name([tag.name for tag in chunk])
+
+                    remaining = []
+                    for tag in chunk:
+                        tag_id = found.get(tag.name.lower())
+                        if tag_id:
+                            created_tags[tag.name.lower()] = tag_id
+                            logger.info(f"Created tag '{tag.name}' with ID {tag_id}")
+                        else:
+                            remaining.append(tag)
+
+                    await asyncio.gather(*(create_one(tag) for tag in remaining))
+                    return
+
+                result = result or {}
+                for i, tag in enumerate(chunk):
+                    created = result.get(f'a{i}') or {}
+                    if created.get('id'):
+                        created_tags[tag.name.lower()] = created['id']
+                        logger.info(f"Created tag '{tag.name}' with ID {created['id']}")
+                    else:
+                        logger.warning(f"Created tag '{tag.name}' but no ID returned")
+
+            # Up to max_concurrency batched requests in flight at once
+            await asyncio.gather(*(
+                create_chunk(valid_tags[i:i + self.CREATE_BATCH_SIZE])
+                for i in range(0, len(valid_tags), self.CREATE_BATCH_SIZE)
+            ))
 
             return created_tags
 
@@ -145,6 +297,69 @@ class StashClient:
             logger.error(f"Failed in create_tags_batch: {e}")
             return {}
 
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _batched_create_document(tag_count: int) -> str:
+        """Build a mutation document with one aliased tagCreate (a0, a1, ...) per tag.
+
+        Only full chunks and the final partial chunk are ever sent, so each document is built once.
+        """
+        params = ', '.join(f'$n{i}: TagCreateInput!' for i in range(tag_count))
+        fields = ' '.join(f'a{i}: tagCreate(input: $n{i}) {{ id name }}' for i in range(tag_count))
+        return f'mutation BatchCreateTags({params}) {{ {fields} }}'
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _batched_find_document(name_count: int) -> str:
+        """Build a query document with one aliased findTags (a0, a1, ...) per tag name."""
+        params = ', '.join(f'$n{i}: String!' for i in range(name_count))
+        fields = ' '.join(
+            f'a{i}: findTags(tag_filter: {{name: {{value: $n{i}, modifier: EQUALS}}}}) {{ tags {{ id name }} }}'
+            for i in range(name_count)
+        )
+        return f'query FindTagsByName({params}) {{ {fields} }}'
+
+    async def _find_tag_ids_by_name(self, names: List[str]) -> Dict[str, str]:
+        """Look up tags by exact name in one request, returns {lowercase_name: tag_id}.
+
+        Never raises; returns an empty dict if the lookup fails.
+        """
+        variables = {f'n{i}': name for i, name in enumerate(names)}
+        try:
+            result = await self.graphql_client.execute(self._batched_find_document(len(names)), variables)
+        except Exception as e:
+            logger.debug("Failed to look up tags by name: %s", e)
+            return {}
+
+        wanted = {name.lower() for name in names}
+        found: Dict[str, str] = {}
+        for match in (result or {}).values():
+            for tag in (match or {}).get('tags') or []:
+                name = tag['name'].lower()
+                if name in wanted:
+                    found[name] = tag['id']
+        return found
+
+    @classmethod
+    def _build_batched_create_mutation(cls, tags_chunk: List[Tag]) -> Tuple[str, dict]:
+        """Build one mutation creating every tag in tags_chunk.
+
+        Each tag gets its own aliased tagCreate (a0, a1, ...) with input variable n0, n1, ...
+
+        Returns:
+            Tuple of (mutation document, variables)
+        """
+        variables = {}
+        for i, tag in enumerate(tags_chunk):
+            tag_input = {'name': tag.name}
+            if tag.description:
+                tag_input['description'] = tag.description
+            if tag.aliases:
+                tag_input['aliases'] = tag.aliases
+            variables[f'n{i}'] = tag_input
+
+        return cls._batched_create_document(len(tags_chunk)), variables
+
     async def bulk_update_tags(
         self,
         tag_ids: List[str],
@@ -178,67 +393,6 @@ class StashClient:
             logger.error(f"Failed to bulk update tags: {e}")
             return False
 
-    async def update_tag_stash_ids(self, tag_id: str, stash_id_dicts: list) -> bool:
-        """Update only the stash_ids for a tag using raw GraphQL mutation.
-
-        Args:
-            tag_id: Stash tag ID
-            stash_id_dicts: List of {'endpoint': '...', 'stash_id': '...'} dicts
-
-        Returns:
-            True if successful, False otherwise
-        """
-        try:
-            if not stash_id_dicts or not tag_id:
-                logger.debug(f"Skipping stash_ids update: empty dicts or tag_id")
-                return False
-
-            input_data = {
-                'id': tag_id,
-                'stash_ids': stash_id_dicts
-            }
-
-            logger.debug(f"Updating stash_ids for tag {tag_id} with data: {input_data}")
-            result = await self.graphql_client.execute(UPDATE_TAG_STASH_IDS_MUTATION, {'input': input_data})
-
-            if result is None:
-                logger.warning(f"stash_ids update returned None for tag {tag_id}")
-                return False
-
-            if 'tagUpdate' in result:
-                tag_update = result['tagUpdate']
-                stored_stash_ids = tag_update.get('stash_ids', [])
-                logger.debug(f"stash_ids update successful for tag {tag_id}")
-                logger.debug(f"  Sent stash_ids: {stash_id_dicts}")
-                logger.debug(f"  Returned stash_ids from mutation: {stored_stash_ids}")
-
-                # Verify what we got back matches what we sent
-                if stored_stash_ids != stash_id_dicts:
-                    logger.warning(f"  WARNING: Returned stash_ids differ from sent data!")
-                    logger.warning(f"    Expected: {stash_id_dicts}")
-                    logger.warning(f"    Got: {stored_stash_ids}")
-
-                # Query the tag to verify what's actually persisted in the database
-                logger.debug(f"Querying tag {tag_id} to verify database persistence...")
-                query_result = await self.graphql_client.find_tags(
-                    filter_={'id': tag_id}
-                )
-                if query_result and query_result.tags:
-                    queried_tag = query_result.tags[0]
-                    if hasattr(queried_tag, 'stash_ids'):
-                        logger.debug(f"  Database stash_ids: {queried_tag.stash_ids}")
-                        for sid in queried_tag.stash_ids:
-                            logger.debug(f"    - endpoint='{getattr(sid, 'endpoint', 'MISSING')}' stash_id='{getattr(sid, 'stash_id', 'MISSING')}'")
-
-                return True
-            else:
-                logger.warning(f"stash_ids update missing 'tagUpdate' in response for tag {tag_id}: {result}")
-                return False
-
-        except Exception as e:
-            logger.error(f"Exception updating stash_ids for tag {tag_id}: {e}")
-            return False
-
     async def update_tags_batch(
         self,
         tags_with_ids: List[Tuple],
@@ -247,11 +401,14 @@ class StashClient:
     ) -> int:
         """Update multiple tags individually with stash_ids, returns count of successful updates.
 
+        Each tag's fields and any new stash_id are sent in a single tagUpdate mutation.
+
         Args:
             tags_with_ids: List of (tag_id, tag, existing_stash_ids, stash_id) tuples
                 - tag_id: Stash tag ID
                 - tag: Tag object with name, description, aliases
-                - existing_stash_ids: List of existing stash_id dicts
+                - existing_stash_ids: List of existing {'endpoint': ..., 'stash_id': ...} dicts,
+                  as held by ExistingTag (plain dicts, not pydantic objects)
                 - stash_id: StashDB ID to add (if not already present)
         """
         try:
@@ -262,6 +419,7 @@ class StashClient:
                 return 0
 
             updated_count = 0
+            semaphore = asyncio.Semaphore(self.max_concurrency)
 
             # Suppress stash_graphql_client logs during progress bar to avoid interruptions
             graphql_logger = logging.getLogger('stash_graphql_client')
@@ -269,75 +427,33 @@ class StashClient:
             if progress:
                 graphql_logger.setLevel(logging.CRITICAL)
 
-            for idx, (tag_id, tag, existing_stash_ids, stash_id) in enumerate(tags_with_ids, 1):
-                try:
-                    graphql_tag = GraphQLTag.model_construct(id=tag_id)
+            use_progress = progress is not None
 
-                    graphql_tag.name = tag.name
-                    if tag.description:
-                        graphql_tag.description = tag.description
-                    if tag.aliases:
-                        graphql_tag.aliases = tag.aliases
+            async def update_one(item: Tuple) -> None:
+                nonlocal updated_count
+                async with semaphore:
+                    status, msg = await self._update_one_tag(*item)
 
-                    result = await self.graphql_client.update_tag(graphql_tag)
-                    if result:
-                        updated_count += 1
-                        if progress is None:
-                            logger.info(f"Updated tag '{tag.name}' (ID: {tag_id})")
-
-                        # Update stash_ids if we have a new one to add
-                        if stash_id:
-                            # Convert existing stash_ids to plain dicts (may be pydantic objects)
-                            stash_id_dicts = []
-                            if existing_stash_ids:
-                                for item in existing_stash_ids:
-                                    if isinstance(item, dict):
-                                        stash_id_dicts.append(item)
-                                    else:
-                                        # Handle pydantic model
-                                        stash_id_dicts.append({
-                                            'endpoint': getattr(item, 'endpoint', ''),
-                                            'stash_id': getattr(item, 'stash_id', '')
-                                        })
-
-                            # Check if this stash_id is already present
-                            stash_id_set = {item.get('stash_id') for item in stash_id_dicts}
-                            if stash_id not in stash_id_set:
-                                stash_id_dicts.append({
-                                    'endpoint': 'https://stashdb.org/graphql',
-                                    'stash_id': stash_id
-                                })
-                                stash_ids_success = await self.update_tag_stash_ids(tag_id, stash_id_dicts)
-                                if stash_ids_success:
-                                    if progress is None:
-                                        logger.info(f"Added StashDB ID {stash_id} to tag '{tag.name}'")
-                                else:
-                                    msg = f"Failed to add StashDB ID {stash_id} to tag '{tag.name}'"
-                                    if progress is not None:
-                                        progress.console.print(f"[yellow]Warning[/yellow] {msg}")
-                                    else:
-                                        logger.warning(msg)
+                if status == 'failed':
+                    if use_progress:
+                        progress.console.print(f"[red]Error[/red] {msg}")
                     else:
-                        msg = f"Update returned no result for tag '{tag.name}' (ID: {tag_id})"
-                        if progress is not None:
+                        logger.error(msg)
+                else:
+                    updated_count += 1
+                    if status == 'warning':
+                        if use_progress:
                             progress.console.print(f"[yellow]Warning[/yellow] {msg}")
                         else:
-                            logger.error(msg)
+                            logger.warning(msg)
+                    elif not use_progress:
+                        logger.info(msg)
 
-                    if progress is not None and task_id is not None:
-                        progress.update(task_id, completed=idx)
+                if use_progress and task_id is not None:
+                    progress.update(task_id, advance=1)
 
-                except Exception as e:
-                    msg = f"Failed to update tag '{tag.name}' (ID: {tag_id}): {e}"
-                    if progress is not None:
-                        progress.console.print(f"[red]Error[/red] {msg}")
-                    else:
-                        logger.error(msg)
-                        logger.debug(f"  Tag data: name={tag.name}, desc={tag.description}, aliases={tag.aliases}")
-
-                    if progress is not None and task_id is not None:
-                        progress.update(task_id, completed=idx)
-                    continue
+            # Up to max_concurrency updates in flight at once
+            await asyncio.gather(*(update_one(item) for item in tags_with_ids))
 
             logger.info(f"Successfully updated {updated_count} tags")
             return updated_count
@@ -350,3 +466,47 @@ class StashClient:
             if progress and original_level is not None:
                 graphql_logger = logging.getLogger('stash_graphql_client')
                 graphql_logger.setLevel(original_level)
+
+    async def _update_one_tag(self, tag_id, tag: Tag, existing_stash_ids, stash_id) -> Tuple[str, str]:
+        """Update one tag's fields, and add its StashDB ID if missing, in a single tagUpdate.
+
+        Never raises; failures are reported through the returned status.
+
+        Returns:
+            Tuple of (status, message), where status is 'updated', 'warning' (updated, but
+            the StashDB ID was not stored) or 'failed'
+        """
+        try:
+            tag_input = {'id': tag_id, 'name': tag.name}
+            if tag.description:
+                tag_input['description'] = tag.description
+            if tag.aliases:
+                tag_input['aliases'] = tag.aliases
+
+            # Send stash_ids in the same mutation if we have a new one to add
+            existing_stash_ids = existing_stash_ids or []
+            adding_stash_id = bool(stash_id) and not any(
+                item['stash_id'] == stash_id for item in existing_stash_ids
+            )
+            if adding_stash_id:
+                tag_input['stash_ids'] = [*existing_stash_ids, {'endpoint': STASHDB_ENDPOINT, 'stash_id': stash_id}]
+
+            result = await self.graphql_client.execute(UPDATE_TAG_MUTATION, {'input': tag_input})
+            tag_update = result.get('tagUpdate') if result else None
+            if not tag_update:
+                return 'failed', f"Update returned no result for tag '{tag.name}' (ID: {tag_id})"
+
+            if not adding_stash_id:
+                return 'updated', f"Updated tag '{tag.name}' (ID: {tag_id})"
+
+            # The echoed stash_ids normally match what was sent; only scan them if not
+            stored_stash_ids = tag_update.get('stash_ids') or []
+            if stored_stash_ids == tag_input['stash_ids'] or any(
+                item.get('stash_id') == stash_id for item in stored_stash_ids
+            ):
+                return 'updated', f"Updated tag '{tag.name}' (ID: {tag_id}) and added StashDB ID {stash_id}"
+            return 'warning', f"Failed to add StashDB ID {stash_id} to tag '{tag.name}'"
+
+        except Exception as e:
+            logger.debug("  Tag data: name=%s, desc=%s, aliases=%s", tag.name, tag.description, tag.aliases)
+            return 'failed', f"Failed to update tag '{tag.name}' (ID: {tag_id}): {e}"
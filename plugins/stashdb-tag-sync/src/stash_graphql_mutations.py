@@ -1,9 +1,10 @@
-"""Raw GraphQL mutations for Stash API operations."""
+"""Raw GraphQL queries and mutations for Stash API operations."""
 
-UPDATE_TAG_STASH_IDS_MUTATION = """
-mutation UpdateTagStashIDs($input: TagUpdateInput!) {
+UPDATE_TAG_MUTATION = """
+mutation UpdateTag($input: TagUpdateInput!) {
     tagUpdate(input: $input) {
         id
+        name
         stash_ids {
             endpoint
             stash_id
@@ -11,3 +12,14 @@ mutation UpdateTagStashIDs($input: TagUpdateInput!) {
     }
 }
 """
+
+LATEST_TAG_UPDATE_QUERY = """
+query LatestTagUpdate {
+    findTags(filter: {per_page: 1, sort: "updated_at", direction: DESC}) {
+        count
+        tags {
+            updated_at
+        }
+    }
+}
+"""
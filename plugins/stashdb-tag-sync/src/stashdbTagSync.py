@@ -4,6 +4,7 @@ import sys
 import json
 import asyncio
 import logging
+import warnings
 from typing import Dict, Any
 
 import stashapi.log as log
@@ -12,15 +13,23 @@ import stashapi.log as log
 logging.getLogger('stash_graphql_client').setLevel(logging.CRITICAL)
 
 try:
-    from graphql_client import StashDBClient
+    from graphql_client import StashDBClient, json_loads
     from stash_client import StashClient
     from core.tag_transfer import transfer_tags_graphql
     from models import Config, StashConnection
+    from traceback_format import format_traceback
 except ImportError as e:
     # If imports fail, output error so Stash can display it
     log.error(f"Import error: {str(e)}")
     sys.exit(1)
 
+# Optional: run the event loop on uvloop when it is installed (not available on Windows)
+try:
+    import uvloop
+    run_async = uvloop.run
+except ImportError:
+    run_async = asyncio.run
+
 
 async def fetch_stashdb_config(stash_client: StashClient) -> tuple[str, str]:
     """Fetch StashDB configuration from Stash's configuration.
@@ -47,29 +56,26 @@ async def fetch_stashdb_config(stash_client: StashClient) -> tuple[str, str]:
             log.error("No stash boxes configured in Stash")
             return ("", "")
 
-        # Find StashDB entry
-        for box in general.stash_boxes:
-            if not isinstance(box, dict):
-                continue
-
-            name = box.get('name', '')
-            api_key = box.get('api_key', '')
-            endpoint = box.get('endpoint', '')
-
-            # Match by endpoint containing '://stashdb.org' (case insensitive)
-            if api_key and endpoint and '://stashdb.org' in endpoint.lower():
-                log.info(f"Found StashDB configuration: {name}")
-                return (api_key, endpoint)
+        # Find StashDB entry, matching by endpoint containing '://stashdb.org' (case insensitive)
+        boxes = [box for box in general.stash_boxes if isinstance(box, dict)]
+        match = next(
+            (
+                box for box in boxes
+                if box.get('api_key') and '://stashdb.org' in (box.get('endpoint') or '').lower()
+            ),
+            None
+        )
+        if match:
+            log.info(f"Found StashDB configuration: {match.get('name', '')}")
+            return (match['api_key'], match['endpoint'])
 
         log.error("No StashDB box found in stash boxes. Configured boxes:")
-        for box in general.stash_boxes:
-            if isinstance(box, dict):
-                log.error(f"  - {box.get('name', 'UNKNOWN')}")
+        for box in boxes:
+            log.error(f"  - {box.get('name', 'UNKNOWN')}")
 
     except Exception as e:
         log.error(f"Failed to fetch StashDB config: {e}")
-        import traceback
-        log.error(f"Traceback: {traceback.format_exc()}")
+        log.error(f"Traceback: {format_traceback(e)}")
 
     return ("", "")
 
@@ -83,7 +89,7 @@ async def plugin_main(input_data: Dict[str, Any]) -> None:
     # Extract server connection information
     server_conn = input_data.get("server_connection", {})
 
-    # Create Stash connection to query configuration
+    # Create Stash connection, used for both the configuration query and the transfer
     stash_conn = StashConnection(
         scheme=server_conn.get("Scheme", "http"),
         host=server_conn.get("Host", "localhost"),
@@ -96,52 +102,41 @@ async def plugin_main(input_data: Dict[str, Any]) -> None:
     ignored_aliases: list = []
 
     try:
-        # Fetch StashDB configuration from Stash (no auth needed for config queries)
-        log.info("Fetching StashDB configuration from Stash...")
-
-        # Create connection with blank API key for initial config fetch
-        # (no API key needed to query Stash configuration)
-        config_conn = StashConnection(
-            scheme=stash_conn.scheme,
-            host=stash_conn.host,
-            port=stash_conn.port,
-            api_key=""
-        )
+        # One client (and one pooled connection) serves both the config fetch and the transfer
+        async with StashClient(stash_conn) as stash_client:
+            # Fetch StashDB configuration from Stash
+            log.info("Fetching StashDB configuration from Stash...")
 
-        # Temporarily suppress stash_graphql_client's noisy warnings during config fetch
-        import os
-        stderr_fd = os.dup(2)
-        devnull_fd = os.open(os.devnull, os.O_WRONLY)
-        os.dup2(devnull_fd, 2)
-        try:
-            async with StashClient(config_conn) as stash_client:
+            # stash_graphql_client's logger is already silenced above; parsing the configuration
+            # also raises Python warnings, which would otherwise go straight to stderr
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
                 stashdb_api_key, stashdb_endpoint = await fetch_stashdb_config(stash_client)
-        finally:
-            os.close(devnull_fd)
-            os.dup2(stderr_fd, 2)
-            os.close(stderr_fd)
-
-        # Validate configuration
-        if not stashdb_api_key:
-            log.error("StashDB not configured in Stash. Configure it in Settings → Metadata Providers → StashDB")
-            sys.exit(1)
-
-        # Create configuration
-        config = Config(
-            stashdb_api_key=stashdb_api_key,
-            ignored_aliases=ignored_aliases
-        )
 
-        # Fetch tags from StashDB
-        log.info("Fetching tags from StashDB GraphQL API...")
-        stashdb_client = StashDBClient(endpoint=stashdb_endpoint, api_key=stashdb_api_key)
-        tags = stashdb_client.query_all_tags(use_cache=use_cache)
-        log.info(f"Fetched {len(tags)} tags from StashDB")
-
-        # Transfer tags to Stash
-        log.info("Transferring tags to Stash...")
-        async with StashClient(stash_conn) as stash_client:
-            stats = await transfer_tags_graphql(stash_client, tags, config)
+            # Validate configuration
+            if not stashdb_api_key:
+                log.error("StashDB not configured in Stash. Configure it in Settings → Metadata Providers → StashDB")
+                sys.exit(1)
+
+            # Create configuration
+            config = Config(
+                stashdb_api_key=stashdb_api_key,
+                ignored_aliases=ignored_aliases
+            )
+
+            # Fetch tags from StashDB (in a worker thread, as the client is synchronous)
+            # while the existing tags are fetched from Stash
+            log.info("Fetching tags from StashDB GraphQL API...")
+            stashdb_client = StashDBClient(endpoint=stashdb_endpoint, api_key=stashdb_api_key)
+            tags, existing_tags = await asyncio.gather(
+                asyncio.to_thread(stashdb_client.query_all_tags, use_cache=use_cache),
+                stash_client.find_existing_tags_with_data(use_cache=use_cache)
+            )
+            log.info(f"Fetched {len(tags)} tags from StashDB")
+
+            # Transfer tags to Stash
+            log.info("Transferring tags to Stash...")
+            stats = await transfer_tags_graphql(stash_client, tags, config, existing_tags=existing_tags)
 
         # Display transfer summary
         log.info("=" * 50)
@@ -161,24 +156,22 @@ async def plugin_main(input_data: Dict[str, Any]) -> None:
         sys.exit(130)
     except Exception as e:
         log.error(f"Operation failed: {str(e)}")
-        import traceback
-        log.error(f"Traceback: {traceback.format_exc()}")
+        log.error(f"Traceback: {format_traceback(e)}")
         sys.exit(1)
 
 
 def main() -> None:
     """Entry point for plugin execution."""
     try:
-        input_data = json.load(sys.stdin)
-        asyncio.run(plugin_main(input_data))
+        input_data = json_loads(sys.stdin.buffer.read())
+        run_async(plugin_main(input_data))
 
     except json.JSONDecodeError as e:
         log.error(f"Invalid JSON input: {e}")
         sys.exit(1)
     except Exception as e:
         log.error(f"Plugin error: {str(e)}")
-        import traceback
-        log.error(f"Traceback: {traceback.format_exc()}")
+        log.error(f"Traceback: {format_traceback(e)}")
         sys.exit(1)
 
 
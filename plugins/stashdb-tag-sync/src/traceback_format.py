@@ -0,0 +1,10 @@
+"""Traceback formatting shared by the plugin wrapper and entry point."""
+import traceback
+
+# Innermost stack frames included in logged tracebacks
+TRACEBACK_LIMIT = 8
+
+
+def format_traceback(e: BaseException) -> str:
+    """Format the innermost TRACEBACK_LIMIT frames of an exception's traceback."""
+    return "".join(traceback.TracebackException.from_exception(e, limit=-TRACEBACK_LIMIT).format())
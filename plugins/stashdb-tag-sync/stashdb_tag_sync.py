@@ -9,29 +9,30 @@ import json
 from pathlib import Path
 import os
 
-try:
-    # Diagnostic: Log startup environment
-    startup_info = {
-        "level": "debug",
-        "message": f"Plugin wrapper starting - CWD: {os.getcwd()}, Python: {sys.executable}, Args: {sys.argv}"
-    }
-    print(json.dumps(startup_info), flush=True)
+# Add src directory to path so we can import plugin modules
+sys.path.insert(0, str(Path(__file__).parent / 'src'))
+
+from traceback_format import format_traceback
 
-    # Add src directory to path so we can import plugin modules
-    plugin_dir = Path(__file__).parent
-    src_dir = plugin_dir / 'src'
+# Startup diagnostics are only printed when STASHDB_TAG_SYNC_DEBUG is set
+DEBUG = bool(os.environ.get('STASHDB_TAG_SYNC_DEBUG'))
 
-    if src_dir.exists():
-        sys.path.insert(0, str(src_dir))
-    else:
-        raise FileNotFoundError(f"src directory not found at {src_dir}")
+try:
+    # Diagnostic: Log startup environment
+    if DEBUG:
+        startup_info = {
+            "level": "debug",
+            "message": f"Plugin wrapper starting - CWD: {os.getcwd()}, Python: {sys.executable}, Args: {sys.argv}"
+        }
+        print(json.dumps(startup_info), flush=True)
 
     # Diagnostic: Log stdin availability
-    stdin_info = {
-        "level": "debug",
-        "message": f"stdin isatty: {sys.stdin.isatty()}, stdin readable: {not sys.stdin.isatty()}"
-    }
-    print(json.dumps(stdin_info), flush=True)
+    if DEBUG:
+        stdin_info = {
+            "level": "debug",
+            "message": f"stdin isatty: {sys.stdin.isatty()}, stdin readable: {not sys.stdin.isatty()}"
+        }
+        print(json.dumps(stdin_info), flush=True)
 
     # Import and run the plugin
     from stashdbTagSync import main
@@ -40,8 +41,7 @@ try:
         main()
 
 except Exception as e:
-    import traceback
-    tb = traceback.format_exc()
-    error_msg = json.dumps({"level": "error", "message": f"Plugin wrapper error: {str(e)}\n{tb}"})
+    # Innermost frames only; deep import chains aren't worth formatting
+    error_msg = json.dumps({"level": "error", "message": f"Plugin wrapper error: {str(e)}\n{format_traceback(e)}"})
     print(error_msg, flush=True)
     sys.exit(1)